@@ -54,6 +54,8 @@ class DAS(object):
     def steering_vector_2D(self, frequency, phi):
 
         dist = 1.0
+        # frequency can also be an array broadcast against the
+        # (microphone, angle) axis of the steering vectors
         phi = np.array([phi]).reshape(phi.size)
 
         # Assume phi and dist are measured from the array's center
@@ -85,9 +87,8 @@ class DAS(object):
         dist_m = -np.dot(self.L.T, src)
         self.dist_cent = dist_m - dist_m.max()
 
-        for i, f in enumerate(self.frequencies):
-            wavenum = 2*np.pi*f/self.c
-            self.weights[i,:] = np.exp(1j * wavenum * self.dist_cent) / self.L.shape[1]
+        wavenum = 2*np.pi*self.frequencies/self.c
+        self.weights[:,:] = np.exp(1j * wavenum[:,None] * self.dist_cent) / self.L.shape[1]
 
 
 
@@ -95,11 +96,9 @@ class DAS(object):
 
         self.angles = np.linspace(0, 2*np.pi, num_angles, endpoint=False)
 
-        resp = np.zeros((len(self.frequencies), num_angles), dtype=complex)
-
-        for i, f in enumerate(self.frequencies):
-            resp[i,:] = np.dot(H(self.weights[i,:]), 
-                self.steering_vector_2D(f, self.angles))
+        # steering vectors of all the frequencies, axis: (frequency, microphone, angle)
+        steering = self.steering_vector_2D(self.frequencies[:,None,None], self.angles)
+        resp = np.einsum('fm,fma->fa', np.conj(self.weights), steering)
 
         self.direct = np.abs(resp)**2
         self.direct /= self.direct.max()
@@ -12,6 +12,16 @@ def H(A):
     """Returns the conjugate (Hermitian) transpose of a matrix."""
     return np.transpose(A).conj()
 
+def solve_hermitian(R, b):
+    """
+    Solves R[i] x[i] = b[i] for a stack of Hermitian matrices R and vectors b.
+    The pseudo-inverse is used if one of the matrices is singular.
+    """
+    try:
+        return np.linalg.solve(R, b[:,:,None])[:,:,0]
+    except np.linalg.LinAlgError:
+        return np.einsum('fmn,fn->fm', np.linalg.pinv(R), b)
+
 class MVB(object):
 
     def __init__(self, mic_pos, fs, nfft=256, c=343., direction=0., num_angles=60, num_snapshots=25, mu=0.):
@@ -86,18 +96,29 @@ class MVB(object):
         dist_m = -np.dot(self.L.T, src)
         dist_m = dist_m - dist_m.min()
 
-        for i, f in enumerate(self.frequencies):
-            wavenum = 2*np.pi*f/self.c
-            # mode_vecs = 1./dist_m * np.exp(-1j*wavenum*dist_m) # near field model
-            mode_vecs = np.exp(-1j*wavenum*dist_m) # fair field model
-            w = np.dot(H(mode_vecs), np.linalg.pinv(self.Rhat[i,:,:]+
-                self.mu*np.diag(self.Rhat[i,:,:])*np.identity(self.M,dtype=complex)))
-            self.weights[i,:] = w / np.dot(w,mode_vecs)
+        # all the frequencies at once, axis: (frequency, microphone)
+        wavenum = 2*np.pi*self.frequencies/self.c
+        # mode_vecs = 1./dist_m * np.exp(-1j*wavenum[:,None]*dist_m) # near field model
+        mode_vecs = np.exp(-1j*wavenum[:,None]*dist_m) # fair field model
+
+        # diagonal loading by mu times the diagonal
+        R = self.Rhat + self.mu*self.Rhat*np.identity(self.M, dtype=complex)
+
+        # w = a^H R^-1 = conj(R^-1 a), as R is Hermitian
+        if self.mu > 0:
+            w = np.conj(solve_hermitian(R, mode_vecs))
+        else:
+            # without loading, R is rank deficient when there are fewer snapshots
+            # than microphones, and solve does not always detect it
+            w = np.conj(np.einsum('fmn,fn->fm', np.linalg.pinv(R), mode_vecs))
+        self.weights[:,:] = w / np.sum(w*mode_vecs, axis=1)[:,None]
 
 
     def steering_vector_2D(self, frequency, phi):
 
         dist = 1.0
+        # frequency can also be an array broadcast against the
+        # (microphone, angle) axis of the steering vectors
         phi = np.array([phi]).reshape(phi.size)
 
         # Assume phi and dist are measured from the array's center
@@ -114,11 +135,9 @@ class MVB(object):
 
         self.angles = np.linspace(0, 2*np.pi, num_angles, endpoint=False)
 
-        resp = np.zeros((len(self.frequencies), num_angles), dtype=complex)
-
-        for i, f in enumerate(self.frequencies):
-            resp[i,:] = np.dot(H(self.weights[i,:]), 
-                self.steering_vector_2D(f, self.angles))
+        # steering vectors of all the frequencies, axis: (frequency, microphone, angle)
+        steering = self.steering_vector_2D(self.frequencies[:,None,None], self.angles)
+        resp = np.einsum('fm,fma->fa', np.conj(self.weights), steering)
 
         self.direct = np.abs(resp)**2
         self.direct /= self.direct.max()
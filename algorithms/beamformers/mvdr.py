@@ -74,17 +74,23 @@ class MVDR(object):
         dist_m = np.linalg.norm(self.L - np.tile(src, (self.M,1)).T, 
             axis=0)
 
-        for i, f in enumerate(self.frequencies):
-            wavenum = 2*np.pi*f/self.c
-            mode_vecs = 1./dist_m * np.exp(-1j*wavenum*dist_m) # near field model
-            w = np.dot(H(mode_vecs),
-                np.linalg.pinv(self.Rhat[i,:,:]+0.1*np.identity(self.M,dtype=complex)))
-            self.weights[i,:] = w / np.dot(w,mode_vecs)
+        # all the frequencies at once, axis: (frequency, microphone)
+        wavenum = 2*np.pi*self.frequencies/self.c
+        mode_vecs = 1./dist_m * np.exp(-1j*wavenum[:,None]*dist_m) # near field model
+
+        # diagonal loading makes the matrices invertible
+        R = self.Rhat + 0.1*np.identity(self.M)
+
+        # w = a^H R^-1 = conj(R^-1 a), as R is Hermitian
+        w = np.conj(np.linalg.solve(R, mode_vecs[:,:,None])[:,:,0])
+        self.weights[:,:] = w / np.sum(w*mode_vecs, axis=1)[:,None]
 
 
     def steering_vector_2D(self, frequency, phi):
 
         dist = 1.0
+        # frequency can also be an array broadcast against the
+        # (microphone, angle) axis of the steering vectors
         phi = np.array([phi]).reshape(phi.size)
 
         # Assume phi and dist are measured from the array's center
@@ -101,11 +107,9 @@ class MVDR(object):
 
         self.angles = np.linspace(0, 2*np.pi, num_angles, endpoint=False)
 
-        resp = np.zeros((len(self.frequencies), num_angles), dtype=complex)
-
-        for i, f in enumerate(self.frequencies):
-            resp[i,:] = np.dot(H(self.weights[i,:]), 
-                self.steering_vector_2D(f, self.angles))
+        # steering vectors of all the frequencies, axis: (frequency, microphone, angle)
+        steering = self.steering_vector_2D(self.frequencies[:,None,None], self.angles)
+        resp = np.einsum('fm,fma->fa', np.conj(self.weights), steering)
 
         self.direct = np.abs(resp)**2
         self.direct /= self.direct.max()
@@ -11,4 +11,6 @@ from .music import *
 from .frida import *
 from .cssm import *
 from .waves import *
-from .tops import *
\ No newline at end of file
+from .tops import *
+from .streaming import *
+from .gccphat import *
\ No newline at end of file
@@ -0,0 +1,115 @@
+'''
+Cache on disk of the precomputations of the DoA algorithms: the mode vectors,
+the neighbors of the points of GridSphere and the mapping matrices of FRIDA.
+They are then computed only once, instead of at each start of a script and
+each new configuration.
+
+The files are named after a hash of everything they are computed from
+(geometry of the array, sampling frequency, FFT size, grid, parameters of the
+algorithm), so a change of parameters never loads stale data. The arrays are
+stored as .npy files, memory-mapped when loaded, next to the list of their
+names: an entry with a missing file is computed again.
+
+The cache is disabled until a directory is set:
+
+    import algorithms as rt
+    rt.doa.cache.directory = '~/.cache/easy-dsp'
+'''
+from __future__ import division, print_function
+
+import os
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+# where the files are stored, None to disable the cache
+directory = None
+
+def key(name, params):
+    '''
+    Name of the entry of the cache for the parameters params (a list of
+    numbers, strings or arrays).
+    '''
+
+    h = hashlib.sha1(name.encode('utf-8'))
+
+    for p in params:
+        if isinstance(p, (np.ndarray, list, tuple)):
+            a = np.ascontiguousarray(p)
+            h.update(('%s %s' % (a.dtype.str, a.shape)).encode('utf-8'))
+            h.update(a.tobytes())
+        else:
+            h.update(repr(p).encode('utf-8'))
+
+    return '%s-%s' % (name, h.hexdigest()[:24])
+
+def filename(name, params, ext='.npy'):
+    '''
+    Path of the file of the cache for the parameters params, or None if the
+    cache is disabled.
+    '''
+
+    if directory is None:
+        return None
+
+    path = os.path.expanduser(directory)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # created by another process in the meantime
+            if not os.path.isdir(path):
+                raise
+
+    return os.path.join(path, key(name, params) + ext)
+
+def load(path, mmap_mode='r'):
+    '''
+    Returns the dictionary of arrays of the entry of the cache at path, or
+    None if it is missing or incomplete.
+    '''
+
+    try:
+        with open(os.path.join(path, 'names.txt')) as f:
+            names = f.read().split()
+        return dict((n, np.load(os.path.join(path, n + '.npy'), mmap_mode=mmap_mode))
+                    for n in names)
+    except (IOError, OSError, ValueError):
+        return None
+
+def cached(name, params, compute, mmap_mode='r'):
+    '''
+    Returns the dictionary of arrays returned by compute(), loaded from the
+    cache if they were already computed for the same parameters, otherwise
+    computed and stored in the cache.
+    '''
+
+    path = filename(name, params, ext='')
+    if path is None:
+        return compute()
+
+    if os.path.isdir(path):
+        arrays = load(path, mmap_mode)
+        if arrays is not None:
+            return arrays
+        # an incomplete entry (e.g. files removed by hand) is computed again
+        shutil.rmtree(path, ignore_errors=True)
+
+    arrays = compute()
+
+    # write in a temporary directory first, so other processes and threads
+    # never see a partial entry; the names of the arrays are written last
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                           dir=os.path.dirname(path))
+    for n, a in arrays.items():
+        np.save(os.path.join(tmp, n + '.npy'), a)
+    with open(os.path.join(tmp, 'names.txt'), 'w') as f:
+        f.write('\n'.join(arrays))
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # stored by another process in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return arrays
@@ -36,6 +36,10 @@ class CSSM(MUSIC):
     :param num_iter: Number of iterations for CSSM. Default: 5
     :type num_iter: int
     """
+
+    # the iterations search for peaks on the whole grid
+    refinable = False
+
     def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None,
         azimuth=None, colatitude=None, num_iter=5, **kwargs):
 
@@ -47,22 +51,22 @@ class CSSM(MUSIC):
         self.A0 = np.identity(self.M, dtype=np.complex64)
         self.Aj = np.identity(self.M, dtype=np.complex64)
         self.Tj = np.zeros((self.M,self.M), dtype=np.complex64)
+        self.CC = np.zeros((self.M, self.M), dtype=np.complex64)
+        self.eigval = np.zeros(self.M, dtype=np.complex64)
+        self.eigvec = np.zeros((self.M,self.M), dtype=np.complex64)
+        self.noise_space = np.zeros((self.M,self.M-self.num_src),dtype=np.complex64)
+        self.music_test = np.zeros((self.M-self.num_src,self.grid.n_points),dtype=np.complex64)
 
 
     # @profile
-    def _process(self, X):
+    def _process_correlation(self, C_hat, power):
         """
-        Perform CSSM for given frame in order to estimate steered response 
-        spectrum.
+        Perform CSSM for given correlation matrices in order to estimate 
+        steered response spectrum.
         """
 
         self.Pssl = np.zeros((self.num_freq,self.grid.n_points))
 
-        # compute empirical cross correlation matrices
-        C_hat = np.zeros([self.num_freq,self.M,self.M], dtype=np.complex64)
-        for i, k in enumerate(self.freq_bins):
-            C_hat[i,:,:] = np.dot(X[:,k,:],X[:,k,:].T.conj())/self.num_snap
-
         # compute initial estimates
         beta = []
         invalid = []
@@ -84,10 +88,10 @@ class CSSM(MUSIC):
         # Here we remove the bands that had too few peaks
         self.freq_bins = np.delete(self.freq_bins, invalid)
         self.num_freq = self.num_freq - len(invalid)
+        power = np.delete(power, invalid)
 
         # compute reference frequency (take bin with max amplitude)
-        f0 = np.argmax(np.sum(np.sum(abs(X[:,self.freq_bins,:]), axis=0),
-            axis=1))
+        f0 = np.argmax(power)
         f0 = self.freq_bins[f0]
 
         # iterate to find DOA, maximum number of iterations is 20
@@ -98,9 +102,8 @@ class CSSM(MUSIC):
             self._coherent_sum(C_hat, f0, beta)
 
             # determine signal and noise subspace
-            self.eigval[:],self.eigvec[:] = np.linalg.eig(self.CC)
-            eigord = np.argsort(abs(self.eigval))
-            self.noise_space[:] = self.eigvec[:,eigord[:-self.num_src]]
+            self.eigval[:],self.eigvec[:] = np.linalg.eigh(self.CC)
+            self.noise_space[:] = self.eigvec[:,:-self.num_src]
 
             # compute spatial spectrum
             self.music_test[:] = np.dot(self.noise_space.conj().T, 
@@ -5,8 +5,10 @@ from __future__ import division, print_function
 """Direction of Arrival (DoA) estimation."""
 
 import numpy as np
-import math, sys
+import math, sys, os
+import tempfile
 import warnings
+from collections import OrderedDict
 from abc import ABCMeta, abstractmethod
 
 # from .detect_peaks import detect_peaks
@@ -26,23 +28,56 @@ if matplotlib_available:
     from matplotlib.ticker import LinearLocator, FormatStrFormatter
 
 from .grid import GridCircle, GridSphere
+from . import cache
 
 tol = 1e-14
 
 
 class ModeVector(object):
     '''
-    This class fakes a very large look-up table of mode vectors
+    This class fakes a very large look-up table of mode vectors, of size
+    (nfft/2+1) x M x grid size.
+
+    The mode vectors of a frequency bin are computed, in single precision,
+    the first time they are needed, and kept in a least recently used cache
+    of at most max_memory bytes. Alternatively, the whole table can be
+    precomputed, in memory or in a memory-mapped file that several processes
+    share.
+
+    Parameters
+    ----------
+    L: ndarray
+        Contains the locations of the microphones in the columns
+    fs: int or float
+        Sampling frequency
+    nfft: int
+        FFT size
+    c: float
+        Speed of sound
+    grid: Grid
+        The grid of candidate locations
+    mode: str, optional
+        'far' or 'near' for far-field or near-field (default 'far')
+    precompute: bool, optional
+        Whether to compute the whole table in memory (default False)
+    max_memory: int, optional
+        Maximum size in bytes of the cached frequency bins (default 64 MB)
+    filename: str, optional
+        If set, the whole table is computed once and stored in this .npy
+        file, then memory-mapped. The file is recomputed if it does not
+        match the parameters.
     '''
 
-    def __init__(self, L, fs, nfft, c, grid, mode='far', precompute=False):
+    def __init__(self, L, fs, nfft, c, grid, mode='far', precompute=False,
+                 max_memory=64 * 2**20, filename=None):
 
         if (nfft % 2 == 1):
             raise ValueError('Signal length must be even.')
 
         # this flag controls if the look-up table should be stored
         # or computed on the fly
-        self.precompute = precompute
+        self.precompute = precompute or filename is not None
+        self.dtype = np.complex64
 
         # short hands for propagation vectors, upped to 3D array
         p_x = grid.x[None, None, :]
@@ -68,44 +103,99 @@ class ModeVector(object):
             # projection
             dist = (p_x * r_x) + (p_y * r_y) + (p_z * r_z)
 
-        # shape (nfft // 2 + 1)
+        # shape (1, num_mics, grid_size)
         self.tau = dist / c
 
-        # shape (1, num_mics, grid_size)
+        # shape (nfft // 2 + 1)
         self.omega = 2 * np.pi * fs * np.arange(nfft // 2 + 1) / nfft
 
-        if precompute:
-            self.mode_vec = np.exp(1j * self.omega[:, None, None] * self.tau)
+        self.shape = (len(self.omega),) + self.tau.shape[1:]
+
+        # the cache of frequency bins, the most recently used last
+        self.cache = OrderedDict()
+        self.cache_size = max(1, max_memory // (np.dtype(self.dtype).itemsize * self.tau.size))
+
+        if filename is not None:
+            self.mode_vec = self._open_file(filename)
+        elif precompute:
+            self.mode_vec = np.array([self._compute(k) for k in range(self.shape[0])])
         else:
             self.mode_vec = None
 
+    def _compute(self, k):
+        ''' The mode vectors of frequency bin k, of size M x grid size '''
+        return np.exp(1j * self.omega[k] * self.tau[0]).astype(self.dtype)
+
+    def _get(self, k):
+        ''' The mode vectors of frequency bin k, from the cache if possible '''
+
+        try:
+            mode_vec = self.cache.pop(k)
+        except KeyError:
+            mode_vec = self._compute(k)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+
+        self.cache[k] = mode_vec
+        return mode_vec
+
+    def _open_file(self, filename):
+        ''' Memory-map the table stored in filename, computing it if necessary '''
+
+        try:
+            mode_vec = np.load(filename, mmap_mode='r')
+            # check a frequency bin to detect a table of other parameters
+            k = self.shape[0] // 2
+            if mode_vec.shape == self.shape and mode_vec.dtype == self.dtype \
+                    and np.allclose(mode_vec[k], self._compute(k), atol=1e-6):
+                return mode_vec
+        except (IOError, ValueError):
+            pass
+
+        # write to a temporary file first, so other processes and threads never
+        # see a partial table
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(os.path.abspath(filename)))
+        os.close(fd)
+        mode_vec = np.lib.format.open_memmap(tmp, mode='w+', dtype=self.dtype, shape=self.shape)
+        for k in range(self.shape[0]):
+            mode_vec[k] = self._compute(k)
+        mode_vec.flush()
+        del mode_vec
+        os.rename(tmp, filename)
+
+        return np.load(filename, mmap_mode='r')
+
     def __getitem__(self, ref):
 
+        if not isinstance(ref, tuple):
+            ref = (ref,)
+        if len(ref) > 3:
+            raise ValueError('Too many axis')
+        ref = ref + (slice(None),) * (3 - len(ref))
+
         # If the look up table was precomputed
-        if self.precompute:
+        if self.mode_vec is not None:
             return self.mode_vec[ref]
 
-        # Otherwise compute values on the fly
-        if isinstance(ref[1], int) and isinstance(ref[2], int):
-            w = self.omega[ref[0]]
-        elif isinstance(ref[1], int) or isinstance(ref[2], int):
-            w = self.omega[ref[0], None]
-        else:
-            w = self.omega[ref[0], None, None]
+        # Otherwise compute values on the fly, only for the requested
+        # frequency bins
+        bins, mics, points = ref
 
-        if isinstance(ref[0], int):
-            tref0 = 0
-        else:
-            tref0 = slice(None, None, None)
-
-        if len(ref) == 1:
-            return np.exp(1j * w * self.tau[tref0, :, :])
-        elif len(ref) == 2:
-            return np.exp(1j * w * self.tau[tref0, ref[1], :])
-        elif len(ref) == 3:
-            return np.exp(1j * w * self.tau[tref0, ref[1], ref[2]])
+        if isinstance(bins, (int, np.integer)):
+            return self._get(bins)[None][(0, mics, points)]
+
+        bins = np.arange(self.shape[0])[bins]
+
+        if isinstance(mics, (slice, int, np.integer)) and isinstance(points, (slice, int, np.integer)):
+            out = np.empty((len(bins),) + self.tau[0, mics, points].shape, dtype=self.dtype)
+            for i, k in enumerate(bins):
+                out[i] = self._get(k)[mics, points]
+            return out
         else:
-            raise ValueError('Too many axis')
+            # several advanced indices, same result as indexing the whole table
+            slab = np.array([self._get(k) for k in bins])
+            return slab[(np.arange(len(bins)), mics, points)]
 
 
 class DOA(object):
@@ -143,12 +233,35 @@ class DOA(object):
     :param dim: The dimension of the problem. Set dim=2 to find sources on the circle (x-y plane).
     Set dim=3 to search on the whole sphere.
     :type dim: int
+    :param refine: If not 0, the sources found on the grid are refined by
+    evaluating the algorithm on so many points around each of them, which 
+    allows a coarse grid with a fine resolution. Only for SRP, GCCPHAT, MUSIC
+    and TOPS. Default: 0
+    :type refine: int
+    :param refine_iter: Number of refinements, each one around the previous
+    estimates with points closer to each other. Default: 1
+    :type refine_iter: int
+    :param mode_vec_memory: Maximum memory in bytes used by the mode vectors
+    of the frequency bins already used, which are computed on the fly. 
+    Default: 64 MB
+    :type mode_vec_memory: int
+    :param mode_vec_file: If set, the mode vectors of all the frequency bins
+    are stored in this .npy file, memory-mapped and shared by the processes
+    using the same file. By default, they are stored in the cache on disk if
+    it is enabled (see algorithms.doa.cache).
+    :type mode_vec_file: str
     """
 
     __metaclass__ = ABCMeta
 
+    # whether the algorithm can be evaluated on any set of points, to refine
+    # the locations of the sources
+    refinable = False
+
     def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None,
-                 azimuth=None, colatitude=None, n_grid=None, dim=2, *args, **kwargs):
+                 azimuth=None, colatitude=None, n_grid=None, dim=2, refine=0,
+                 refine_iter=1, mode_vec_memory=64 * 2**20, mode_vec_file=None,
+                 *args, **kwargs):
 
         if dim > L.shape[0]:
             raise ValueError('Microphones locations missing dimensions.')
@@ -190,6 +303,14 @@ class DOA(object):
         else:
             self.dim = dim
 
+        # coarse-to-fine search
+        if refine and not self.refinable:
+            raise ValueError("%s cannot refine the locations of the sources." % self.__class__.__name__)
+        if refine == 1 or refine < 0:
+            raise ValueError("At least two points are needed to refine the locations.")
+        self.refine = refine
+        self.refine_iter = refine_iter
+
         # Some logic to create a grid for search
         self.grid = None
         if azimuth is None and colatitude is None:
@@ -251,7 +372,11 @@ class DOA(object):
         from .frida import FRIDA
 
         if not isinstance(self, FRIDA):
-            self.mode_vec = ModeVector(self.L, self.fs, self.nfft, self.c, self.grid, precompute=True)
+            if mode_vec_file is None:
+                mode_vec_file = cache.filename('mode_vec',
+                        [self.L, self.fs, self.nfft, self.c, self.grid.cartesian])
+            self.mode_vec = ModeVector(self.L, self.fs, self.nfft, self.c, self.grid,
+                    max_memory=mode_vec_memory, filename=mode_vec_file)
 
     def locate_sources(self, X, num_src=None, freq_range=[500.0, 4000.0],
                        freq_bins=None, freq_hz=None):
@@ -278,12 +403,7 @@ class DOA(object):
         :type freq_hz: list of floats
         """
 
-        # check validity of inputs
-        if num_src is not None and num_src != self.num_src:
-            self.num_src = self._check_num_src(num_src)
-            self.sources = np.zeros([self.num_src, self.D])
-            self.src_idx = np.zeros(self.num_src, dtype=np.int)
-            self.angle_of_arrival = None
+        self._set_num_src(num_src)
         if X.shape[0] != self.M:
             raise ValueError('Number of signals (rows) does not match the \
                 number of microphones.')
@@ -291,6 +411,74 @@ class DOA(object):
             raise ValueError("Mismatch in FFT length.")
         self.num_snap = X.shape[2]
 
+        self._set_freq_bins(freq_range, freq_bins, freq_hz)
+
+        # search for DoA according to desired algorithm
+
+        # initialize the grid value to zero
+        self.grid.set_values(0.)
+
+        # Run the algorithm
+        self._process(X)
+
+        self._find_sources()
+
+    def locate_sources_from_correlation(self, C_hat, power=None, num_src=None,
+                                        freq_range=[500.0, 4000.0],
+                                        freq_bins=None, freq_hz=None):
+        """
+        Locate source(s) from correlation matrices that were already 
+        estimated, for example accumulated over many frames by StreamingDOA.
+
+        :param C_hat: Correlation matrices of the signals for all the 
+        frequency bins, as returned by _compute_correlation_matrices. Size 
+        should be F x M x M, where F should correspond to nfft/2+1.
+        :type C_hat: numpy array
+        :param power: Power of the signals in each of the F frequency bins, 
+        used to choose the reference frequency of CSSM, WAVES and TOPS. 
+        Default is computed from the diagonal of C_hat.
+        :type power: numpy array
+        :param num_src: Number of sources to detect. Default is value given to 
+        object constructor.
+        :type num_src: int
+        :param freq_range: Frequency range on which to run DoA: [fmin, fmax].
+        :type freq_range: list of floats, length 2
+        :param freq_bins: List of individual frequency bins on which to run 
+        DoA.
+        :type freq_bins: list of int
+        :param freq_hz: List of individual frequencies on which to run DoA.
+        :type freq_hz: list of floats
+        """
+
+        self._set_num_src(num_src)
+        if C_hat.shape != (self.max_bin, self.M, self.M):
+            raise ValueError("The correlation matrices should be of size \
+                (nfft/2+1, M, M).")
+
+        self._set_freq_bins(freq_range, freq_bins, freq_hz)
+
+        if power is None:
+            power = np.sum(np.sqrt(np.abs(np.diagonal(C_hat, axis1=1, axis2=2))), axis=1)
+
+        self.grid.set_values(0.)
+
+        self._C_hat = C_hat[self.freq_bins]
+        self._power = power[self.freq_bins]
+        self._process_correlation(self._C_hat, self._power)
+
+        self._find_sources()
+
+    def _set_num_src(self, num_src):
+
+        # check validity of inputs
+        if num_src is not None and num_src != self.num_src:
+            self.num_src = self._check_num_src(num_src)
+            self.sources = np.zeros([self.num_src, self.D])
+            self.src_idx = np.zeros(self.num_src, dtype=np.int)
+            self.angle_of_arrival = None
+
+    def _set_freq_bins(self, freq_range, freq_bins, freq_hz):
+
         # frequency bins on which to apply DOA
         if freq_bins is not None:
             self.freq_bins = freq_bins
@@ -307,13 +495,7 @@ class DOA(object):
         self.freq_hz = self.freq_bins * float(self.fs) / float(self.nfft)
         self.num_freq = len(self.freq_bins)
 
-        # search for DoA according to desired algorithm
-
-        # initialize the grid value to zero
-        self.grid.set_values(0.)
-
-        # Run the algorithm
-        self._process(X)
+    def _find_sources(self):
 
         # locate sources
         from .frida import FRIDA
@@ -329,6 +511,123 @@ class DOA(object):
                 self.azimuth_recon = self.grid.azimuth[self.src_idx]
                 self.colatitude_recon = self.grid.colatitude[self.src_idx]
 
+            if self.refine:
+                self._refine_sources()
+
+    def _refine_sources(self):
+        """
+        Evaluate the algorithm on points around each source found on the 
+        grid, and move the source to the best one, refine_iter times. The
+        values of the grid are left unchanged.
+        """
+
+        grid, mode_vec = self.grid, self.mode_vec
+
+        # distance between the points of the grid
+        if self.dim == 2:
+            spacing = 2 * np.pi / grid.n_points
+        else:
+            spacing = np.sqrt(4 * np.pi / grid.n_points)
+
+        azimuth = np.array(self.azimuth_recon, dtype=float)
+        if self.dim == 2:
+            colatitude = np.pi / 2 * np.ones(azimuth.shape)
+        else:
+            colatitude = np.array(self.colatitude_recon, dtype=float)
+
+        try:
+            for i in range(self.refine_iter):
+
+                for s in range(len(azimuth)):
+
+                    # the mode vectors of the local points are computed on the fly
+                    local = self._local_grid(azimuth[s], colatitude[s], spacing)
+                    local.set_values(0.)
+                    self._use_grid(local, ModeVector(self.L, self.fs, self.nfft, self.c, local))
+                    self._process_correlation(self._C_hat, self._power)
+
+                    best = np.argmax(local.values)
+                    azimuth[s] = local.azimuth[best]
+                    colatitude[s] = local.colatitude[best]
+
+                # next time, search between the local points
+                if self.dim == 2:
+                    spacing = 2 * spacing / (self.refine - 1)
+                else:
+                    spacing = spacing * np.sqrt(np.pi / self.refine)
+
+        finally:
+            self._use_grid(grid, mode_vec)
+
+        self.azimuth_recon = azimuth
+        if self.dim == 3:
+            self.colatitude_recon = colatitude
+
+    def _local_grid(self, azimuth, colatitude, radius):
+        """
+        Grid of refine points around a direction, up to radius away from it.
+        """
+
+        if self.dim == 2:
+            return GridCircle(azimuth=azimuth + np.linspace(-radius, radius, self.refine))
+
+        # Fibonacci sampling of a spherical cap around the pole, from the pole
+        # to the edge of the cap
+        n = np.arange(self.refine)
+        cos_theta = 1 - (1 - np.cos(radius)) * n / (self.refine - 1)
+        sin_theta = np.sqrt(1 - cos_theta**2)
+        phi = n * np.pi * (3. - np.sqrt(5.))
+
+        # rotate the pole to the direction
+        center = spher2cart(1, azimuth, colatitude)
+        e_colatitude = np.array([np.cos(azimuth) * np.cos(colatitude),
+                                 np.sin(azimuth) * np.cos(colatitude),
+                                 -np.sin(colatitude)])
+        e_azimuth = np.array([-np.sin(azimuth), np.cos(azimuth), 0.])
+        points = center[:, None] * cos_theta \
+                + e_colatitude[:, None] * (sin_theta * np.cos(phi)) \
+                + e_azimuth[:, None] * (sin_theta * np.sin(phi))
+
+        spherical = np.array([np.arctan2(points[1], points[0]),
+                              np.arccos(np.clip(points[2], -1, 1))])
+        return GridSphere(spherical_points=spherical, find_neighbors=False)
+
+    def _use_grid(self, grid, mode_vec):
+        """
+        Set the grid on which the algorithm is evaluated, and its mode vectors.
+        """
+        self.grid = grid
+        self.mode_vec = mode_vec
+
+    def _process(self, X):
+        """
+        Run the algorithm on the STFT frames X (M x F x S). By default, the
+        correlation matrices of the selected bins are estimated, and the
+        algorithm is run on them.
+        """
+
+        self._C_hat = self._compute_correlation_matrices(X)
+        self._power = np.sum(np.sum(np.abs(X[:, self.freq_bins, :]), axis=0), axis=1)
+        self._process_correlation(self._C_hat, self._power)
+
+    def _process_correlation(self, C_hat, power):
+        """
+        Run the algorithm on the correlation matrices C_hat (F x M x M) of the
+        selected frequency bins, power being the power in each of them.
+        """
+        raise NotImplementedError('%s cannot run on correlation matrices.' % self.__class__.__name__)
+
+    def _compute_correlation_matrices(self, X, freq_bins=None):
+        """
+        Estimate the correlation matrices of the frequency bins freq_bins 
+        (default: the selected bins), averaged over the snapshots of X.
+        Returns an array of size len(freq_bins) x M x M.
+        """
+        if freq_bins is None:
+            freq_bins = self.freq_bins
+        Xf = X[:, freq_bins, :]
+        return np.einsum('mfs,nfs->fmn', Xf, np.conj(Xf)) / X.shape[2]
+
     def polar_plt_dirac(self, phi_ref=None, alpha_ref=None, save_fig=False,
                         file_name=None, plt_dirty_img=True):
         """
@@ -365,7 +664,8 @@ class DOA(object):
 
         else:  # create dirty image
 
-            dirty_img = self._gen_dirty_img()
+            # the phases are kept for the next plots of the same bins
+            dirty_img = self._gen_dirty_img(cache_phases=True)
             alpha_recon = np.mean(np.abs(self.alpha_recon), axis=1)
             alpha_recon /= alpha_recon.max()
             if alpha_ref is None:  # non-simulated case
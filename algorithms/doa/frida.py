@@ -9,11 +9,16 @@ from .tools_fri_doa_plane import pt_src_recon_multiband, extract_off_diag, cov_m
 
 
 class FRIDA(DOA):
+
+    # number of sets of frequency bands whose mapping matrices are kept in memory
+    G_cache_size = 32
+
     def __init__(self, L, fs, nfft, max_four=None, c=343.0, num_src=1,
                  G_iter=None, max_ini=5, n_rot=10, max_iter=50, noise_level=1e-10, 
                  low_rank_cleaning=False, stopping='max_iter',
                  stft_noise_floor=0., stft_noise_margin=1.5, signal_type='visibility',
-                 use_lu=True, verbose=False, symb=True, **kwargs):
+                 use_lu=True, verbose=False, symb=True, n_jobs=1,
+                 track=False, track_ini=2, **kwargs):
         '''
         Parameters
         ----------
@@ -39,7 +44,10 @@ class FRIDA(DOA):
         noise_level: float, optional
             Noise level in the visibility measurements, if available (default 1e-10)
         stopping: str, optional
-            Stopping criteria for the recovery algorithm. Can be max iterations or noise level (default max_iter)
+            Stopping criteria for the recovery algorithm. Can be max iterations ('max_iter') or
+            noise level ('mse'), in which case the random initializations stop as soon as one
+            of them fits the measurements within noise_level. With n_jobs > 1, this is checked
+            separately by each process, on its own share of the initializations (default max_iter)
         stft_noise_floor: float
             The noise floor in the STFT measurements, if available (default 0)
         stft_noise_margin: float
@@ -55,6 +63,16 @@ class FRIDA(DOA):
             Whether to output intermediate result for debugging purposes
         symb: bool, optional
             Whether enforce the symmetry on the reconstructed uniform samples of sinusoids b
+        n_jobs: int, optional
+            Number of processes running the random initializations in parallel, -1 for all
+            the CPUs. The processes do not share the 'mse' stopping: each one runs its
+            initializations until one of them reaches noise_level (default 1)
+        track: bool, optional
+            Tracking mode, for successive frames of a stream: the recovery algorithm starts
+            from the sources found in the previous frame, plus track_ini random
+            initializations instead of max_ini (default False)
+        track_ini: int, optional
+            Number of random initializations in tracking mode (default 2)
         '''
 
         DOA.__init__(self, L, fs, nfft, c=c, num_src=num_src, mode='far', **kwargs)
@@ -80,9 +98,25 @@ class FRIDA(DOA):
         self.use_lu = use_lu
         self.verbose = verbose
         self.symb = symb
+        self.n_jobs = n_jobs
+        self.track = track
+        self.track_ini = track_ini
+
+        # the sources found in the previous frame, in tracking mode
+        self.azimuth_track = None
 
+        # the mapping matrices of the recently used sets of frequency bands
+        self.G_cache = OrderedDict()
         self.G = None
 
+        # the microphone pairs (q, qp) of the visibilities R[qp, q]
+        self.mic_pairs = np.nonzero(1 - np.eye(self.M))
+
+        # the phases of the dirty images of the frequency bins, if cached, and
+        # the grid and microphone locations they were computed for
+        self.dirty_img_phases = {}
+        self.dirty_img_geometry = (None, None)
+
         # The type of measurement to use, can be 'visibility' (default) for the covariance
         # matrix, or 'raw' to use microphone signals directly
         self.signal_type = signal_type
@@ -96,10 +130,8 @@ class FRIDA(DOA):
         '''
 
         if self.signal_type == 'visibility':
-            visi_noisy_all = self._visibilities(X)
-
-            # stack as columns (NOT SUBTRACTING NOISELESS)
-            self.visi_noisy_all = np.column_stack(visi_noisy_all)
+            # one band per column (NOT SUBTRACTING NOISELESS)
+            self.visi_noisy_all = self._visibilities(X)
 
             signal = self.visi_noisy_all
 
@@ -109,6 +141,28 @@ class FRIDA(DOA):
         else:
             raise ValueError("Signal type can be 'visibility' or 'raw'.")
 
+        self._reconstruct(signal)
+
+    def _process_correlation(self, C_hat, power):
+        '''
+        Parameters
+        ----------
+        C_hat: ndarray
+            The correlation matrices of the selected frequency bins
+        power: ndarray
+            The power in each of the selected frequency bins (unused)
+        '''
+
+        if self.signal_type != 'visibility':
+            raise ValueError("Only the signal type 'visibility' can be computed from correlation matrices.")
+
+        # cov_mtx_est gives the transpose of the correlation matrices
+        self.visi_noisy_all = self._visibility(np.swapaxes(C_hat, 1, 2))
+
+        self._reconstruct(self.visi_noisy_all)
+
+    def _reconstruct(self, signal):
+
         # loop over all subbands
         self.num_freq = self.freq_bins.shape[0]
 
@@ -116,15 +170,14 @@ class FRIDA(DOA):
 
         if self.dim == 2:
 
-            # build the G matrix if necessary
-            if self.G is None:
-                self.G = make_G(
-                        self.L[0,:], self.L[1,:],
-                        2 * np.pi * self.freq_hz, self.c,
-                        self.max_four,
-                        signal_type=self.signal_type
-                        )
-                self.GtG, self.GtG_inv = make_GtG_and_inv(self.G)
+            # the G matrices of the selected frequency bands
+            self._set_G()
+
+            # in tracking mode, start from the sources of the previous frame
+            max_ini, doa_ini = self.max_ini, None
+            if self.track and self.azimuth_track is not None \
+                    and len(self.azimuth_track) == self.num_src:
+                max_ini, doa_ini = self.track_ini, self.azimuth_track
 
             # reconstruct point sources with FRI
             self.azimuth_recon, self.alpha_recon = \
@@ -133,7 +186,7 @@ class FRIDA(DOA):
                             self.L[0, :], self.L[1, :],
                             2 * np.pi * self.freq_hz, self.c,
                             self.num_src, self.max_four,
-                            self.noise_level, self.max_ini,
+                            self.noise_level, max_ini,
                             max_iter=self.max_iter,
                             update_G=self.update_G,
                             G_iter=self.G_iter,
@@ -141,9 +194,52 @@ class FRIDA(DOA):
                             signal_type=self.signal_type,
                             G_lst=self.G,
                             GtG_lst=self.GtG,
-                            GtG_inv_lst=self.GtG_inv
+                            GtG_inv_lst=self.GtG_inv,
+                            stop_cri=self.stop_cri,
+                            n_jobs=self.n_jobs,
+                            doa_ini=doa_ini
                             )
 
+            if self.track:
+                self.azimuth_track = self.azimuth_recon
+
+    def reset_tracking(self):
+        ''' Forget the sources found in the previous frame '''
+        self.azimuth_track = None
+
+    def _set_G(self):
+        ''' Use the mapping matrices of the selected frequency bands '''
+
+        key = tuple(self.freq_bins)
+
+        try:
+            matrices = self.G_cache.pop(key)
+        except KeyError:
+            matrices = cache.cached('frida_G',
+                    [self.L[:2,:], self.freq_hz, self.c, self.max_four, self.signal_type],
+                    self._make_G)
+            if len(self.G_cache) >= self.G_cache_size:
+                self.G_cache.popitem(last=False)
+
+        self.G_cache[key] = matrices
+
+        self.G = matrices['G']
+        self.GtG = matrices['GtG']
+        self.GtG_inv = matrices['GtG_inv']
+
+    def _make_G(self):
+        ''' The mapping matrices of the selected frequency bands '''
+
+        G = make_G(
+                self.L[0,:], self.L[1,:],
+                2 * np.pi * self.freq_hz, self.c,
+                self.max_four,
+                signal_type=self.signal_type
+                )
+        GtG, GtG_inv = make_GtG_and_inv(G)
+
+        return { 'G': G, 'GtG': GtG, 'GtG_inv': GtG_inv }
+
     def _raw_average(self, X):
         ''' Correct the time rotation and average the raw microphone signal '''
         phaser = np.exp(-1j * 2 * np.pi * self.freq_hz[:, None] * np.arange(X.shape[2]) * self.nfft / self.fs)
@@ -151,69 +247,93 @@ class FRIDA(DOA):
         return np.mean(X[:, self.freq_bins, :] * phaser, axis=2)
 
     def _visibilities(self, X):
+        ''' The visibilities of all the selected bands, one band per column '''
+
+        X = X[:, self.freq_bins, :]
+
+        # only use the frames with enough energy
+        energy = np.var(X, axis=0)
+        mask = energy > self.stft_noise_margin * self.stft_noise_floor
 
-        visi_noisy_all = []
-        for band_count in range(self.num_freq):
-            # Estimate the covariance matrix and extract off-diagonal entries
-            fn = self.freq_bins[band_count]
-            energy = np.var(X[:, fn, :], axis=0)
-            I = np.where(energy > self.stft_noise_margin * self.stft_noise_floor)
-            R = cov_mtx_est(X[:, fn, I[0]])
-
-            # impose low rank constraint
-            if self.low_rank_cleaning:
-                w, vl = la.eig(R)
-                order = np.argsort(w)
-                sig = order[-self.num_src:]
-                sigma = (np.trace(R) - np.sum(w[sig])) / (R.shape[0] - self.num_src)
-                Rhat = np.dot(vl[:,sig], np.dot(np.diag(w[sig] - sigma), np.conj(vl[:,sig].T)))
-            else:
-                Rhat = R
-
-            visi_noisy = extract_off_diag(Rhat)
-            visi_noisy_all.append(visi_noisy)
-
-        return visi_noisy_all
-
-    def _gen_dirty_img(self):
+        # the covariance matrices of all the bands, as estimated by cov_mtx_est
+        R = np.einsum('pfs,qfs->fpq', np.conj(X) * mask, X) \
+                / np.sum(mask, axis=1)[:, None, None]
+
+        return self._visibility(R)
+
+    def _visibility(self, R):
+        '''
+        Extract the visibilities from covariance matrices of size bands x M x M,
+        one band per column
+        '''
+
+        # impose low rank constraint
+        if self.low_rank_cleaning:
+            bands = np.arange(R.shape[0])[:, None]
+            w, vl = np.linalg.eig(R)
+            order = np.argsort(w, axis=1)
+            sig = order[:, -self.num_src:]
+            w_sig, vl_sig = w[bands, sig], vl[bands, :, sig].transpose(0, 2, 1)
+            sigma = (np.trace(R, axis1=1, axis2=2) - np.sum(w_sig, axis=1)) / (R.shape[1] - self.num_src)
+            Rhat = np.einsum('fpk,fk,fqk->fpq', vl_sig, w_sig - sigma[:, None], np.conj(vl_sig))
+        else:
+            Rhat = R
+
+        # the off-diagonal entries, in the order of extract_off_diag
+        q, qp = self.mic_pairs
+        return Rhat[:, qp, q].T
+
+    def _gen_dirty_img(self, cache_phases=False):
         """
         Compute the dirty image associated with the given measurements. Here the Fourier transform
         that is not measured by the microphone array is taken as zero.
+        :param cache_phases: keep the phases of the image of each frequency bin in memory, so that
+            the next images are faster to compute (a microphone pairs x grid size matrix per bin).
+            They are computed again if self.grid or self.L is replaced
         :return:
         """
 
-        sound_speed = self.c
         num_mic = self.M
 
         assert(self.dim == 2)
 
         if self.dim == 2:
 
-            x_plt, y_plt = polar2cart(1, self.grid.azimuth)
             img = np.zeros(self.grid.n_points, dtype=complex)
 
-            pos_mic_x = self.L[0, :]
-            pos_mic_y = self.L[1, :]
             for i in range(self.num_freq):
-
-                visi = self.visi_noisy_all[:, i]
-                omega_band = 2 * np.pi * self.freq_hz[i]
-
-                pos_mic_x_normalised = pos_mic_x / (sound_speed / omega_band)
-                pos_mic_y_normalised = pos_mic_y / (sound_speed / omega_band)
-
-                count_visi = 0
-                for q in range(num_mic):
-                    p_x_outer = pos_mic_x_normalised[q]
-                    p_y_outer = pos_mic_y_normalised[q]
-                    for qp in range(num_mic):
-                        if not q == qp:
-                            p_x_qqp = p_x_outer - pos_mic_x_normalised[qp]  # a scalar
-                            p_y_qqp = p_y_outer - pos_mic_y_normalised[qp]  # a scalar
-                            # <= the negative sign converts DOA to propagation vector
-                            img += visi[count_visi] * \
-                                   np.exp(-1j * (p_x_qqp * x_plt + p_y_qqp * y_plt))
-                            count_visi += 1
+                phases = self._dirty_img_phases(self.freq_bins[i], cache_phases)
+                img += np.dot(self.visi_noisy_all[:, i], phases)
 
             return img / (num_mic * (num_mic - 1))
 
+    def _dirty_img_phases(self, k, cache_phases=False):
+        ''' The phases of the dirty image of frequency bin k, of size microphone pairs x grid size '''
+
+        # the cached phases are only valid for the grid and array they were computed for
+        grid, L = self.dirty_img_geometry
+        if grid is not self.grid or L is not self.L:
+            self.dirty_img_phases = {}
+            self.dirty_img_geometry = (self.grid, self.L)
+
+        if k in self.dirty_img_phases:
+            return self.dirty_img_phases[k]
+
+        x_plt, y_plt = polar2cart(1, self.grid.azimuth)
+        omega_band = 2 * np.pi * k * float(self.fs) / float(self.nfft)
+
+        pos_mic_x_normalised = self.L[0, :] / (self.c / omega_band)
+        pos_mic_y_normalised = self.L[1, :] / (self.c / omega_band)
+
+        # the differences of positions of the microphone pairs of the visibilities
+        q, qp = self.mic_pairs
+        p_x_qqp = pos_mic_x_normalised[q] - pos_mic_x_normalised[qp]
+        p_y_qqp = pos_mic_y_normalised[q] - pos_mic_y_normalised[qp]
+
+        # <= the negative sign converts DOA to propagation vector
+        phases = np.exp(-1j * (p_x_qqp[:, None] * x_plt + p_y_qqp[:, None] * y_plt))
+
+        if cache_phases:
+            self.dirty_img_phases[k] = phases
+
+        return phases
@@ -0,0 +1,108 @@
+from __future__ import division, print_function
+
+from .srp import *
+
+class GCCPHAT(SRP):
+    """
+    Class to apply Steered Response Power (SRP) direction-of-arrival (DoA)
+    from the GCC-PHAT cross-correlations of the microphone pairs.
+
+    The cross-correlation of each pair is computed once per frame with an
+    inverse FFT, and the response of a grid point is the sum over the pairs
+    of the cross-correlations at the time differences of arrival of this
+    point, which are computed beforehand. The cost grows with the number of
+    pairs times the number of grid points, instead of also with the number
+    of frequencies, so this is much faster than SRP on large 3D grids.
+
+    .. note:: Run locate_source() to apply the algorithm.
+
+    :param L: Microphone array positions. Each column should correspond to the
+    cartesian coordinates of a single microphone.
+    :type L: numpy array
+    :param fs: Sampling frequency.
+    :type fs: float
+    :param nfft: FFT length.
+    :type nfft: int
+    :param c: Speed of sound. Default: 343 m/s
+    :type c: float
+    :param num_src: Number of sources to detect. Default: 1
+    :type num_src: int
+    :param mode: 'far' or 'near' for far-field or near-field detection
+    respectively. Default: 'far'
+    :type mode: str
+    :param r: Candidate distances from the origin. Default: np.ones(1)
+    :type r: numpy array
+    :param azimuth: Candidate azimuth angles (in radians) with respect to x-axis.
+    Default: np.linspace(-180.,180.,30)*np.pi/180
+    :type azimuth: numpy array
+    :param colatitude: Candidate elevation angles (in radians) with respect to z-axis.
+    Default is x-y plane search: np.pi/2*np.ones(1)
+    :type colatitude: numpy array
+    :param interp: Upsampling factor of the cross-correlations. The
+    correlations are further linearly interpolated between their samples.
+    Default: 4
+    :type interp: int
+    """
+
+    def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None,
+        azimuth=None, colatitude=None, interp=4, **kwargs):
+
+        SRP.__init__(self, L=L, fs=fs, nfft=nfft, c=c, num_src=num_src,
+            mode=mode, r=r, azimuth=azimuth, colatitude=colatitude, **kwargs)
+
+        self.interp = interp
+        self.n_lags = self.nfft * self.interp
+        self.grid_mode_vec = self.mode_vec
+
+        # the distinct microphone pairs
+        self.pairs = np.triu_indices(self.M, 1)
+
+        self._set_lags()
+        self.grid_lags = self.lag_index0, self.lag_index1, self.lag_weight
+
+    def _use_grid(self, grid, mode_vec):
+
+        SRP._use_grid(self, grid, mode_vec)
+
+        if mode_vec is self.grid_mode_vec:
+            self.lag_index0, self.lag_index1, self.lag_weight = self.grid_lags
+        else:
+            self._set_lags()
+
+    def _set_lags(self):
+
+        # time difference of arrival of each grid point for each pair, in
+        # (upsampled) samples of the cross-correlations
+        tau = self.mode_vec.tau[0]
+        lags = (tau[self.pairs[1]] - tau[self.pairs[0]]) * self.fs * self.interp
+
+        # indices in the flattened cross-correlations of the samples around
+        # each lag (negative lags are at the end), and interpolation weights
+        lag0 = np.floor(lags)
+        self.lag_weight = lags - lag0
+        offset = self.n_lags * np.arange(len(self.pairs[0]))[:,None]
+        self.lag_index0 = (lag0.astype(int) % self.n_lags) + offset
+        self.lag_index1 = ((lag0.astype(int) + 1) % self.n_lags) + offset
+
+    def _process_correlation(self, CC, power):
+        """
+        Perform SRP-PHAT for given correlation matrices by looking up the
+        GCC-PHAT cross-correlations of the microphone pairs.
+        """
+
+        # cross-spectra of the pairs, restricted to the selected frequencies
+        spectra = np.zeros((len(self.pairs[0]), self.max_bin), dtype=complex)
+        spectra[:,self.freq_bins] = CC[:,self.pairs[0],self.pairs[1]].T
+
+        # cross-correlations
+        cc = np.fft.irfft(spectra, n=self.n_lags, axis=1).ravel()
+
+        # interpolate at the delays of each grid point, and sum over the pairs
+        values = (1 - self.lag_weight) * cc[self.lag_index0] \
+                + self.lag_weight * cc[self.lag_index1]
+        srp_cost = np.sum(values, axis=0)
+
+        # Finally normalize
+        srp_cost *= self.n_lags / 2 / self.num_freq / self.num_pairs
+
+        self.grid.set_values(srp_cost)
@@ -11,6 +11,7 @@ from scipy.spatial import ConvexHull, SphericalVoronoi
 from abc import ABCMeta, abstractmethod
 
 from detect_peaks import detect_peaks
+from . import cache
 
 class Grid:
     '''
@@ -138,7 +139,7 @@ class GridCircle(Grid):
 
 class GridSphere(Grid):
 
-    def __init__(self, n_points=1000, spherical_points=None):
+    def __init__(self, n_points=1000, spherical_points=None, find_neighbors=True):
         '''
         This function computes nearly equidistant points on the sphere
         using the fibonacci method
@@ -150,6 +151,9 @@ class GridSphere(Grid):
         spherical_points: ndarray, optional
             A 2 x n_points array of spherical coordinates with azimuth in
             the top row and colatitude in the second row. Overrides n_points.
+        find_neighbors: bool, optional
+            Whether to compute the neighbors of each point, needed by
+            find_peaks (default True).
 
         References
         ----------
@@ -200,7 +204,22 @@ class GridSphere(Grid):
             self.azimuth[:] = np.arctan2(self.y, self.x)
             self.colatitude[:] = np.arctan2(np.sqrt(self.x**2 + self.y**2), self.z)
 
-        
+        self.hull = None
+        self.neighbors = None
+        if find_neighbors:
+            self._find_neighbors()
+
+    def _find_neighbors(self):
+
+        # the neighbors of point i are indices[indptr[i]:indptr[i+1]]
+        adjacency = cache.cached('grid_neighbors', [self.cartesian], self._compute_neighbors)
+        indptr, indices = adjacency['indptr'].tolist(), adjacency['indices'].tolist()
+
+        # convert to list of lists
+        self.neighbors = [ indices[indptr[i]:indptr[i+1]] for i in range(self.n_points) ]
+
+    def _compute_neighbors(self):
+
         # To perform the peak detection in 2D on a non-squared grid it is
         # necessary to know the neighboring points of each grid point.  The
         # Convex Hull of points on the sphere is equivalent to the Delauney
@@ -223,8 +242,10 @@ class GridSphere(Grid):
             adjacency[tri[2]].add(tri[0])
             adjacency[tri[2]].add(tri[1])
 
-        # convert to list of lists
-        self.neighbors = [ list(x) for x in adjacency ]
+        indptr = np.cumsum([0] + [ len(x) for x in adjacency ])
+        indices = np.array([ u for x in adjacency for u in sorted(x) ], dtype=int)
+
+        return { 'indptr': indptr, 'indices': indices }
 
 
     def apply(self, func, spherical=False):
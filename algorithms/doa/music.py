@@ -33,6 +33,9 @@ class MUSIC(DOA):
     Default is x-y plane search: np.pi/2*np.ones(1)
     :type colatitude: numpy array
     """
+
+    refinable = True
+
     def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None,
         azimuth=None, colatitude=None, **kwargs):
 
@@ -41,36 +44,24 @@ class MUSIC(DOA):
             colatitude=colatitude, **kwargs)
 
         self.Pssl = None
-        self.CC = np.zeros((self.M, self.M), dtype=np.complex64)
-        self.eigval = np.zeros(self.M, dtype=np.complex64)
-        self.eigvec = np.zeros((self.M,self.M), dtype=np.complex64)
-        self.noise_space = np.zeros((self.M,self.M-self.num_src),dtype=np.complex64)
-        self.music_test = np.zeros((self.M-self.num_src,self.grid.n_points),dtype=np.complex64)
         
     # @profile
-    def _process(self, X):
+    def _process_correlation(self, C_hat, power):
         """
-        Perform MUSIC for given frame in order to estimate steered response 
-        spectrum.
+        Perform MUSIC for given correlation matrices in order to estimate 
+        steered response spectrum.
         """
 
-        self.Pssl = np.zeros((self.num_freq,self.grid.n_points))
-
-        # compute response for each frequency
-        for i, k in enumerate(self.freq_bins):
-
-            # estimate cross correlation
-            self.CC[:] = np.dot(X[:,k,:], np.conj(X[:,k,:]).T) 
-
-            # determine signal and noise subspace
-            self.eigval[:],self.eigvec[:] = np.linalg.eig(self.CC)
-            eigord = np.argsort(abs(self.eigval))
-            self.noise_space[:] = self.eigvec[:,eigord[:-self.num_src]]
+        # determine signal and noise subspace of all the frequencies at once,
+        # the eigenvalues of the hermitian matrices are in ascending order
+        eigval, eigvec = np.linalg.eigh(C_hat)
+        noise_space = eigvec[:,:,:-self.num_src]
 
-            # compute spatial spectrum
-            self.music_test[:] = np.dot(self.noise_space.conj().T, 
-                self.mode_vec[k,:,:])
-            self.Pssl[i,:] = 1/np.sum(np.multiply(self.music_test,self.music_test.conj()), axis=0).real
+        # compute spatial spectrum for all the frequencies and grid points
+        music_test = np.matmul(np.conj(np.swapaxes(noise_space, 1, 2)),
+            self.mode_vec[self.freq_bins,:,:])
+        self.Pssl = 1/(np.einsum('fkn,fkn->fn', music_test.real, music_test.real)
+            + np.einsum('fkn,fkn->fn', music_test.imag, music_test.imag))
 
         self.grid.set_values(np.sum(self.Pssl, axis=0)/self.num_freq)
 
@@ -92,32 +83,28 @@ class MUSIC(DOA):
         return 1/music_pow
 
 
-    def _compute_correlation_matrices(self, X):
-        C_hat = np.zeros([self.num_freq,self.M,self.M], dtype=complex)
-        for i, k in enumerate(self.freq_bins):
-            C_hat[i,:,:] = np.dot(X[:,k,:],X[:,k,:].T.conj())
-        return C_hat/self.num_snap
-
-
     def _subspace_decomposition(self, R):
+        """
+        Signal and noise subspaces of the hermitian matrix R (M x M), or of
+        a stack of them (F x M x M), all decomposed at once.
+        """
 
-        # eigenvalue decomposition!
-        w,v = np.linalg.eig(R)
+        # eigenvalue decomposition, in descending order
+        w,v = np.linalg.eigh(R)
+        w = w[...,::-1]
+        v = v[...,::-1]
 
         # sort out signal and noise subspace
         # Signal comprises the leading eigenvalues
         # Noise takes the rest
-        eig_order = np.flipud(np.argsort(abs(w)))
-        sig_space = eig_order[:self.num_src]
-        noise_space = eig_order[self.num_src:]
 
         # eigenvalues
-        ws = w[sig_space]
-        wn = w[noise_space]
+        ws = w[...,:self.num_src]
+        wn = w[...,self.num_src:]
 
         # eigenvectors
-        Es = v[:,sig_space]
-        En = v[:,noise_space]
+        Es = v[...,:self.num_src]
+        En = v[...,self.num_src:]
 
         return Es, En, ws, wn
 
@@ -33,58 +33,61 @@ class SRP(DOA):
     :param colatitude: Candidate elevation angles (in radians) with respect to z-axis.
     Default is x-y plane search: np.pi/2*np.ones(1)
     :type colatitude: numpy array
+    :param chunk_size: Number of grid points for which the steered response 
+    is computed at once. Bounds the memory used with large grids. Default: 512
+    :type chunk_size: int
     """
+
+    refinable = True
+
     def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None, 
-        azimuth=None, colatitude=None, **kwargs):
+        azimuth=None, colatitude=None, chunk_size=512, **kwargs):
 
         DOA.__init__(self, L=L, fs=fs, nfft=nfft, c=c, num_src=num_src, 
             mode=mode, r=r, azimuth=azimuth, colatitude=colatitude, **kwargs)
 
         self.num_pairs = self.M*(self.M-1)/2
+        self.chunk_size = chunk_size
 
         #self.mode_vec = np.conjugate(self.mode_vec)
 
-    def _process(self, X):
+    def _compute_correlation_matrices(self, X, freq_bins=None):
         """
-        Perform SRP-PHAT for given frame in order to estimate steered response 
-        spectrum.
+        Correlation matrices of the PHAT weighted signals.
         """
 
-        ones = np.ones(self.L.shape[1])
-
-        srp_cost = np.zeros(self.grid.n_points)
+        if freq_bins is None:
+            freq_bins = self.freq_bins
 
         # apply PHAT weighting
+        X = X[:, freq_bins, :]
         absX = np.abs(X)
         absX[absX < tol] = tol
         pX = X / absX
 
-        CC = []
-        for k in self.freq_bins:
-            CC.append( np.dot(pX[:,k,:], np.conj(pX[:,k,:]).T) )
-        CC = np.array(CC)
+        return DOA._compute_correlation_matrices(self, pX, np.arange(len(freq_bins)))
 
-        for n in range(self.grid.n_points):
+    def _process_correlation(self, CC, power):
+        """
+        Perform SRP-PHAT for given correlation matrices in order to estimate 
+        steered response spectrum.
+        """
+
+        srp_cost = np.zeros(self.grid.n_points)
 
-            # get the mode vector axis: (frequency, microphones)
-            mode_vec = self.mode_vec[self.freq_bins,:,n]
-            '''
-            # This could allow not to keep all mode vectors in memory
-            omega = self.mode_omega[self.freq_bins,None]
-            tau = self.mode_tau[:,:,n]
-            mode_vec = np.exp(-1j * omega * tau)
-            '''
+        # only the distinct microphone pairs are summed
+        CC = np.triu(CC, 1)
 
-            # compute the outer product along the microphone axis
-            mode_mat = np.conj(mode_vec[:,:,None]) * mode_vec[:,None,:]
+        for start in range(0, self.grid.n_points, self.chunk_size):
+            chunk = slice(start, min(start + self.chunk_size, self.grid.n_points))
 
-            # multiply covariance by mode vectors and sum over the frequencies
-            R = np.sum(CC * mode_mat, axis=0)
+            # mode vectors of the chunk, axis: (frequency, microphones, points)
+            mode_vec = self.mode_vec[self.freq_bins,:,chunk]
 
-            # Now sum over all distince microphone pairs
-            sum_val = np.inner(ones, np.dot(np.triu(R, 1), ones))
+            # quadratic forms a^H CC a, summed over the frequencies
+            sum_val = np.sum(np.conj(mode_vec) * np.matmul(CC, mode_vec), axis=(0,1))
 
             # Finally normalize
-            srp_cost[n] = np.abs(sum_val) / self.num_snap/self.num_freq/self.num_pairs
+            srp_cost[chunk] = np.abs(sum_val) / self.num_freq/self.num_pairs
 
         self.grid.set_values(srp_cost)
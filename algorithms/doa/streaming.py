@@ -0,0 +1,131 @@
+from __future__ import division, print_function
+
+from collections import deque
+
+from doa import *
+
+class StreamingDOA(object):
+    """
+    Keeps the correlation matrices of all the frequency bins up to date as new
+    STFT frames arrive, and runs a DoA algorithm on them on demand. Each new
+    snapshot is only used once, and the sources can be located from many more
+    snapshots than fit in one audio buffer.
+
+    .. note:: Call update() with the new frames, then locate_sources().
+
+    :param doa: DoA object (SRP, MUSIC, CSSM, WAVES, TOPS, or FRIDA with
+    signal_type='visibility') used to compute the correlation matrices and to
+    locate the sources.
+    :type doa: DOA
+    :param forget: Forgetting factor between 0 and 1. At each update, the
+    accumulated matrices are weighted by forget, and the new ones by
+    1 - forget. Default: 0.9
+    :type forget: float
+    :param window: If set, the matrices are instead averaged over the last
+    window updates (sliding window), and forget is ignored.
+    :type window: int
+    """
+    def __init__(self, doa, forget=0.9, window=None):
+
+        if window is None and not 0 <= forget < 1:
+            raise ValueError('The forgetting factor must be between 0 and 1.')
+        if window is not None and window < 1:
+            raise ValueError('The window must contain at least one update.')
+
+        self.doa = doa
+        self.forget = forget
+        self.window = window
+        self.bins = np.arange(doa.max_bin)
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all the frames received so far.
+        """
+
+        # sums of the (weighted) matrices and power in each bin
+        self.C_sum = np.zeros((self.doa.max_bin, self.doa.M, self.doa.M), dtype=complex)
+        self.power_sum = np.zeros(self.doa.max_bin)
+        self.weight = 0.
+
+        # the terms of the sums, for the sliding window
+        self.history = deque()
+
+        self.num_updates = 0
+
+    def update(self, X):
+        """
+        Add new frames to the correlation matrices.
+
+        :param X: Set of signals in the frequency (RFFT) domain for the new
+        frames. Size should be M x F x S, where M should correspond to the
+        number of microphones, F to nfft/2+1, and S to the number of snapshots.
+        :type X: numpy array
+        """
+
+        if X.shape[0] != self.doa.M:
+            raise ValueError('Number of signals (rows) does not match the \
+                number of microphones.')
+        if X.shape[1] != self.doa.max_bin:
+            raise ValueError("Mismatch in FFT length.")
+
+        C = self.doa._compute_correlation_matrices(X, self.bins)
+        power = np.sum(np.sum(np.abs(X), axis=0), axis=1) / X.shape[2]
+
+        if self.window is not None:
+            self.C_sum += C
+            self.power_sum += power
+            self.history.append((C, power))
+            if len(self.history) > self.window:
+                C_old, power_old = self.history.popleft()
+                self.C_sum -= C_old
+                self.power_sum -= power_old
+            self.weight = len(self.history)
+        else:
+            self.C_sum *= self.forget
+            self.C_sum += (1 - self.forget) * C
+            self.power_sum *= self.forget
+            self.power_sum += (1 - self.forget) * power
+            self.weight = self.forget * self.weight + (1 - self.forget)
+
+        self.num_updates += 1
+
+    @property
+    def C_hat(self):
+        """
+        The accumulated correlation matrices, of size F x M x M.
+        """
+        return self.C_sum / self.weight
+
+    @property
+    def power(self):
+        """
+        The accumulated power in each frequency bin.
+        """
+        return self.power_sum / self.weight
+
+    def locate_sources(self, num_src=None, freq_range=[500.0, 4000.0],
+                       freq_bins=None, freq_hz=None):
+        """
+        Locate source(s) from the accumulated correlation matrices. The
+        results are in the DoA object (grid, azimuth_recon, ...).
+
+        :param num_src: Number of sources to detect. Default is value given to
+        the DoA object constructor.
+        :type num_src: int
+        :param freq_range: Frequency range on which to run DoA: [fmin, fmax].
+        :type freq_range: list of floats, length 2
+        :param freq_bins: List of individual frequency bins on which to run
+        DoA.
+        :type freq_bins: list of int
+        :param freq_hz: List of individual frequencies on which to run DoA.
+        :type freq_hz: list of floats
+        """
+
+        if self.num_updates == 0:
+            raise ValueError('No frames were received yet.')
+
+        self.doa.locate_sources_from_correlation(self.C_hat, power=self.power,
+                num_src=num_src, freq_range=freq_range, freq_bins=freq_bins,
+                freq_hz=freq_hz)
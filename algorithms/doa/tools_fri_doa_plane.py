@@ -7,7 +7,7 @@ from scipy import linalg
 import scipy.special
 import scipy.optimize
 from functools import partial
-from joblib import Parallel, delayed
+from joblib import Parallel, delayed, effective_n_jobs
 import os
 
 thread_num = 1
@@ -270,6 +270,22 @@ def coef_expan_mtx(K):
     return D1, D2
 
 
+def coef_from_doa(phi_doa, K):
+    """
+    annihilating filter (half of the real and imaginary parts, as expanded by
+    coef_expan_mtx) whose roots correspond to the given Diracs' locations
+    :param phi_doa: Diracs' locations (DOA, azimuth)
+    :param K: number of Diracs. The filter size is K + 1
+    :return:
+    """
+    # propagation vectors, as the roots of the filter
+    uk = np.exp(-1j * (np.reshape(phi_doa, -1) + np.pi))
+    # the roots are on the unit circle: a phase makes the filter Hermitian symmetric
+    coef = np.poly(uk) * np.sqrt(np.prod(-np.conj(uk)))
+    D1, D2 = coef_expan_mtx(K)
+    return np.concatenate((coef.real[:D1.shape[1]], coef.imag[:D2.shape[1]]))
+
+
 def Tmtx_ri(b_ri, K, D, L):
     """
     build convolution matrix associated with b_ri
@@ -831,7 +847,8 @@ def dirac_recon_ri_half(G, a_ri, K, M, noise_level, max_ini=100, stop_cri='mse')
 #             c_opt = c_ri[:K + 1] + 1j * c_ri[K + 1:]  # real and imaginary parts
 #     return c_opt, min_error, b_opt
 
-def dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst, a_ri, K, M, max_ini=100, max_iter=50):
+def dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst, a_ri, K, M, max_ini=100, max_iter=50,
+                                     noise_level=None, stop_cri='max_iter', n_jobs=1, c_ini=None):
     """
     Here we use LU decomposition to precompute a few entries.
         Reconstruct point sources' locations (azimuth) from the visibility measurements.
@@ -845,12 +862,22 @@ def dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst, a_ri, K, M, ma
         :param noise_level: level of noise (ell_2 norm) in the measurements
         :param max_ini: maximum number of initialisations
         :param stop_cri: stopping criterion, either 'mse' or 'max_iter'
+        :param n_jobs: number of processes the initialisations are split between
+                    (-1 for all the CPUs). With stop_cri == 'mse', each process stops
+                    as soon as one of its initialisations reaches the noise level; the
+                    other processes are not stopped, and the best of all the results
+                    is returned.
+        :param c_ini: (half) annihilating filter coefficients to use as initialisations
+                    in addition to the max_ini random ones, one per row
         :return:
         """
     num_bands = a_ri.shape[1]  # number of bands considered
     L = 2 * M + 1  # length of the (complex-valued) b vector for each band
+    compute_mse = (stop_cri == 'mse' and noise_level is not None)
     assert not np.iscomplexobj(np.concatenate(G_lst))  # G should be real-valued
     assert not np.iscomplexobj(np.concatenate(a_ri))  # a_ri should be real-valued
+    if max_ini == 0 and (c_ini is None or np.size(c_ini) == 0):
+        raise ValueError('At least one initialisation is needed (max_ini or c_ini).')
 
     D1, D2 = hermitian_expan(M + 1)
     D = linalg.block_diag(D1, D2)
@@ -883,47 +910,31 @@ def dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst, a_ri, K, M, ma
             beta_ri_loop, K, D, L, D_coef, mtx_shrink))
 
     sz_coef = K + 1
-    rhs = np.append(np.zeros(sz_coef, dtype=float), 1)
-    min_error = float('inf')
 
-    for ini in range(max_ini):
-        c_ri_half = np.random.randn(sz_coef, 1)
-        c0_ri_half = c_ri_half.copy()
-        Rmtx_band = Rmtx_ri_half_out_half(c_ri_half, K, D, L, D_coef, mtx_shrink)
-
-        mtx_loop = \
-            np.vstack((
-                np.hstack((
-                    lu_compute_mtx_obj_initial(GtG_inv_lst, Tbeta_ri_lst,
-                                               Rmtx_band, num_bands, K),
-                    c0_ri_half)),
-                np.append(c0_ri_half, 0).T
-            ))
-        for inner in range(max_iter):
-            # update mtx_loop
-            if inner != 0:
-                # mtx_loop[:sz_coef, :sz_coef] = \
-                #     lu_compute_mtx_obj(Tbeta_ri_lst, num_bands, K, lu_R_GtGinv_Rt_loop)
-                mtx_loop[:sz_coef, :sz_coef] = mtx_loop_upper_left
-            try:
-                c_ri_half = linalg.solve(mtx_loop, rhs, check_finite=False)[:sz_coef]
-            except linalg.LinAlgError:
-                break
-
-            # build R based on the updated c
-            Rmtx_band = Rmtx_ri_half_out_half(c_ri_half, K, D, L, D_coef, mtx_shrink)
-
-            # update b_recon
-            error_loop, mtx_loop_upper_left = \
-                compute_obj_val(GtG_inv_lst, Tbeta_ri_lst, Rmtx_band, c_ri_half, num_bands, K)
+    # the main iteration with different random initialisations
+    partial_dirac_recon = partial(dirac_recon_ri_multiband_lu_inner,
+                                  GtG_inv_lst=GtG_inv_lst, Tbeta_ri_lst=Tbeta_ri_lst,
+                                  K=K, D=D, L=L, D_coef=D_coef,
+                                  mtx_shrink=mtx_shrink, max_iter=max_iter,
+                                  noise_level=noise_level if compute_mse else None)
+
+    # generate all the random initialisations (the same as drawn one at a time)
+    c_ri_half_all = np.random.randn(max_ini, sz_coef)
+    if c_ini is not None:
+        c_ri_half_all = np.vstack((np.reshape(c_ini, (-1, sz_coef)), c_ri_half_all))
+
+    if n_jobs == 1:
+        res_all = [partial_dirac_recon(c_ri_half_all)]
+    else:
+        # split the initialisations between the workers
+        num_workers = min(effective_n_jobs(n_jobs), c_ri_half_all.shape[0])
+        res_all = Parallel(n_jobs=n_jobs)(
+            delayed(partial_dirac_recon)(c_ri_half_chunk)
+            for c_ri_half_chunk in np.array_split(c_ri_half_all, num_workers))
 
-            if error_loop < min_error:
-                min_error = error_loop
-                # b_opt = np.dot(D1, b_recon_ri[:M + 1, :]) + \
-                #         1j * np.dot(D2, b_recon_ri[M + 1:, :])
-                Rmtx_opt = Rmtx_band
-                c_ri = np.dot(D_coef, c_ri_half)
-                c_opt = c_ri[:K + 1] + 1j * c_ri[K + 1:]  # real and imaginary parts
+    # find the one with smallest error
+    min_idx = np.argmin([res[1] for res in res_all])
+    c_opt, min_error, Rmtx_opt = res_all[min_idx]
 
     b_opt_ri = compute_b(G_lst, GtG_lst, beta_ri_lst, Rmtx_opt, num_bands, a_ri, use_lu=True, GtG_inv_lst=GtG_inv_lst)[0]
     b_opt = np.dot(D1, b_opt_ri[:M + 1, :]) + 1j * np.dot(D2, b_opt_ri[M + 1:, :])
@@ -931,6 +942,116 @@ def dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst, a_ri, K, M, ma
     return c_opt, min_error, b_opt
 
 
+def dirac_recon_ri_multiband_lu_inner(c_ri_half_all, GtG_inv_lst, Tbeta_ri_lst,
+                                      K, D, L, D_coef, mtx_shrink, max_iter,
+                                      noise_level=None):
+    """
+    Run the iterations of dirac_recon_ri_half_multiband_lu from several
+    initialisations of the annihilating filter coefficients at once. They all
+    advance in lockstep, so that each step is a few stacked linear solves.
+    :param c_ri_half_all: the initial (half) annihilating filter coefficients,
+                one initialisation per row
+    :param noise_level: stop as soon as the fitting error of one initialisation
+                is below it (None to always run max_iter iterations)
+    :return: the best annihilating filter, its fitting error and the associated
+                right-dual matrix
+    """
+    num_ini, sz_coef = c_ri_half_all.shape
+    GtG_inv_all = np.asarray(GtG_inv_lst)
+    Tbeta_ri_all = np.asarray(Tbeta_ri_lst)
+
+    # R(c) is linear in c: precompute it for each coefficient
+    R_basis = np.array([Rmtx_ri_half_out_half(e, K, D, L, D_coef, mtx_shrink)
+                        for e in np.eye(sz_coef)])
+
+    def build_R(c_ri_half):
+        return np.einsum('ij,jkl->ikl', c_ri_half, R_basis)
+
+    def build_mtx_obj(Rmtx):
+        # sum over the bands of Tbeta^T (R GtG^{-1} R^T)^{-1} Tbeta, for all
+        # the initialisations, axis: (initialisation, band, row, column)
+        R_GtGinv_Rt = np.matmul(np.matmul(Rmtx[:, None], GtG_inv_all[None]),
+                                np.swapaxes(Rmtx, 1, 2)[:, None])
+        sol, valid = solve_stack(R_GtGinv_Rt, Tbeta_ri_all)
+        mtx = np.einsum('bkl,ibkm->ilm', Tbeta_ri_all, sol)
+        return mtx, valid
+
+    c0_ri_half = c_ri_half_all
+    Rmtx_band = build_R(c0_ri_half)
+
+    # the constrained problem min c^T mtx c s.t. c0^T c = 1 is solved with the
+    # bordered matrices [[mtx, c0], [c0^T, 0]]
+    mtx_loop = np.zeros((num_ini, sz_coef + 1, sz_coef + 1))
+    mtx_loop[:, :sz_coef, sz_coef] = c0_ri_half
+    mtx_loop[:, sz_coef, :sz_coef] = c0_ri_half
+    mtx_loop[:, :sz_coef, :sz_coef], active = build_mtx_obj(Rmtx_band)
+    rhs = np.zeros((num_ini, sz_coef + 1, 1))
+    rhs[:, -1] = 1
+
+    min_error = np.full(num_ini, np.inf)
+    c_opt_half = np.zeros((num_ini, sz_coef))
+    Rmtx_opt = np.zeros_like(Rmtx_band)
+
+    for inner in range(max_iter):
+        # drop the initialisations for which a matrix was singular
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+
+        sol, valid = solve_stack(mtx_loop[idx], rhs[idx])
+        active[idx[~valid]] = False
+        idx, c_ri_half = idx[valid], sol[valid, :sz_coef, 0]
+
+        # build R based on the updated c
+        Rmtx_band = build_R(c_ri_half)
+
+        # the fitting errors, and the matrices of the next iteration
+        mtx_obj, valid = build_mtx_obj(Rmtx_band)
+        active[idx[~valid]] = False
+        error_loop = np.sqrt(np.einsum('ik,ikl,il->i', c_ri_half, mtx_obj, c_ri_half))
+        mtx_loop[idx, :sz_coef, :sz_coef] = mtx_obj
+
+        better = valid & (error_loop < min_error[idx])
+        min_error[idx[better]] = error_loop[better]
+        c_opt_half[idx[better]] = c_ri_half[better]
+        Rmtx_opt[idx[better]] = Rmtx_band[better]
+
+        if noise_level is not None and np.min(min_error) < noise_level:
+            break
+
+    best = np.argmin(min_error)
+    if np.isinf(min_error[best]):
+        return None, min_error[best], None
+
+    c_ri = np.dot(D_coef, c_opt_half[best][:, np.newaxis])
+    c_opt = c_ri[:K + 1] + 1j * c_ri[K + 1:]  # real and imaginary parts
+
+    return c_opt, min_error[best], Rmtx_opt[best]
+
+
+def solve_stack(A, B):
+    """
+    Solve the linear systems A[i] X[i] = B[i] for a stack of matrices A, where B is
+    broadcast against A. The solutions of singular systems are set to nan.
+    :param A: the matrices, with the stacking along the first axis
+    :param B: the right-hand sides
+    :return: the solutions and, for each i, whether the system i could be solved
+    """
+    B = np.broadcast_to(B, A.shape[:-1] + B.shape[-1:])
+
+    try:
+        return np.linalg.solve(A, B), np.ones(A.shape[0], dtype=bool)
+    except np.linalg.LinAlgError:
+        X = np.full(B.shape, np.nan)
+        valid = np.ones(A.shape[0], dtype=bool)
+        for i in range(A.shape[0]):
+            try:
+                X[i] = np.linalg.solve(A[i], B[i])
+            except np.linalg.LinAlgError:
+                valid[i] = False
+        return X, valid
+
+
 def dirac_recon_ri_half_multiband(G_lst, a_ri, K, M, max_ini=100):
     """
         Reconstruct point sources' locations (azimuth) from the visibility measurements.
@@ -1544,6 +1665,7 @@ def pt_src_recon_multiband(a, p_mic_x, p_mic_y, omega_bands, sound_speed,
                            update_G=False, verbose=False, signal_type='visibility', 
                            max_iter=50, 
                            G_lst=None, GtG_lst=None, GtG_inv_lst=None, 
+                           stop_cri='max_iter', n_jobs=1, doa_ini=None,
                            **kwargs):
     """
     reconstruct point sources on the circle from the visibility measurements
@@ -1563,6 +1685,12 @@ def pt_src_recon_multiband(a, p_mic_x, p_mic_y, omega_bands, sound_speed,
     :param verbose: whether output intermediate results for debugging or not
     :param signal_type: The type of the signal a, possible values are 'visibility' for covariance matrix
         and 'raw' for microphone inputs
+    :param stop_cri: stopping criterion, either 'mse' (stop the initialisations when the noise
+        level is reached) or 'max_iter'
+    :param n_jobs: number of processes running the random initialisations in parallel (with
+        stop_cri == 'mse', the noise level is checked within each process only)
+    :param doa_ini: K Diracs' locations (DOA), e.g. reconstructed from the previous frame,
+        used as an initialisation in addition to the max_ini random ones
     :param kwargs: possible optional input: G_iter: number of iterations for the G updates
     :return:
     """
@@ -1611,6 +1739,10 @@ def pt_src_recon_multiband(a, p_mic_x, p_mic_y, omega_bands, sound_speed,
     if GtG_lst is None or GtG_inv_lst is None:
         GtG_lst, GtG_inv_lst = make_GtG_and_inv(G_lst)
 
+    c_ini = None
+    if doa_ini is not None and np.size(doa_ini) == K:
+        c_ini = coef_from_doa(doa_ini, K)
+
     for loop_G in range(max_loop_G):
         # c_recon, error_recon = \
         #     dirac_recon_ri_half_multiband_parallel(G, a_ri, K, M, max_ini)[:2]
@@ -1623,7 +1755,9 @@ def pt_src_recon_multiband(a, p_mic_x, p_mic_y, omega_bands, sound_speed,
         '''faster version with lu decomposition'''
         c_recon, error_recon = \
             dirac_recon_ri_half_multiband_lu(G_lst, GtG_lst, GtG_inv_lst,
-                    a_ri, K, M, max_ini, max_iter=max_iter)[:2]
+                    a_ri, K, M, max_ini, max_iter=max_iter,
+                    noise_level=noise_level, stop_cri=stop_cri, n_jobs=n_jobs,
+                    c_ini=c_ini)[:2]
         # toc = time.time()
         # print(toc - tic)
 
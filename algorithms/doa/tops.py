@@ -42,10 +42,10 @@ class TOPS(MUSIC):
         MUSIC.__init__(self, L=L, fs=fs, nfft=nfft, c=c, num_src=num_src, 
             mode=mode, r=r, azimuth=azimuth, colatitude=colatitude, **kwargs)
 
-    def _process(self, X):
+    def _process_correlation(self, C_hat, power):
         """
-        Perform TOPS for a given frame in order to estimate steered response 
-        spectrum.
+        Perform TOPS for given correlation matrices in order to estimate 
+        steered response spectrum.
         """
 
         # need more than 1 frequency band
@@ -53,23 +53,13 @@ class TOPS(MUSIC):
             raise ValueError('Need more than one frequency band!')
 
         # select reference frequency (largest power)
-        max_bin = np.argmax(np.sum(np.sum(abs(X[:,self.freq_bins,:]),axis=0),
-            axis=1))
+        max_bin = np.argmax(power)
         f0 = self.freq_bins[max_bin]
         freq = list(self.freq_bins)
         freq.remove(f0)
 
-        # compute empirical cross correlation matrices
-        C_hat = self._compute_correlation_matrices(X)
-
         # compute signal and noise subspace for each frequency band
-        F = np.zeros((self.num_freq,self.M,self.num_src), dtype='complex64')
-        W = np.zeros((self.num_freq,self.M,self.M-self.num_src), 
-            dtype='complex64')
-        for k in range(self.num_freq):
-            # subspace decomposition
-            F[k,:,:], W[k,:,:], ws, wn = \
-                self._subspace_decomposition(C_hat[k,:,:])
+        F, W, ws, wn = self._subspace_decomposition(C_hat)
 
         # create transformation matrix
         f = 1.0/self.nfft/self.c*1j*2*np.pi*self.fs*(np.linspace(0,self.nfft/2,
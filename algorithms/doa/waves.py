@@ -35,6 +35,10 @@ class WAVES(MUSIC):
     :param num_iter: Number of iterations for CSSM. Default: 5
     :type num_iter: int
     """
+
+    # the iterations search for peaks on the whole grid
+    refinable = False
+
     def __init__(self, L, fs, nfft, c=343.0, num_src=1, mode='far', r=None,
         azimuth=None, colatitude=None, num_iter=5, **kwargs):
 
@@ -45,15 +49,12 @@ class WAVES(MUSIC):
         self.Z = None
 
     # @profile
-    def _process(self, X):
+    def _process_correlation(self, C_hat, power):
         """
-        Perform WAVES for given frame in order to estimate steered response 
-        spectrum.
+        Perform WAVES for given correlation matrices in order to estimate 
+        steered response spectrum.
         """
 
-        # compute empirical cross correlation matrices
-        C_hat = self._compute_correlation_matrices(X)
-
         # # compute initial estimates
         # beta = []
         # for k in range(self.num_freq):
@@ -79,10 +80,10 @@ class WAVES(MUSIC):
 
         self.freq_bins = np.delete(self.freq_bins, invalid)
         self.num_freq = self.num_freq - len(invalid)
+        power = np.delete(power, invalid)
 
         # compute reference frequency (take bin with max amplitude)
-        f0 = np.argmax(np.sum(np.sum(abs(X[:,self.freq_bins,:]), axis=0), 
-            axis=1))
+        f0 = np.argmax(power)
         f0 = self.freq_bins[f0]
 
         # iterate to find DOA (but max 20)
@@ -110,6 +111,8 @@ class WAVES(MUSIC):
 
     # @profile
     def _construct_waves_matrix(self, C_hat, f0, beta):
+        # signal subspaces of all the frequencies
+        Es_all, En_all, ws_all, wn_all = self._subspace_decomposition(C_hat)
         for j in range(len(self.freq_bins)):
             k = self.freq_bins[j]
             Aj = self.mode_vec[k,:,beta[j]].T
@@ -118,7 +121,7 @@ class WAVES(MUSIC):
                 np.identity(self.M-len(beta[j]))), axis=1).T
             Tj = np.dot(np.c_[A0, B], np.linalg.inv(np.c_[Aj, B]))
             # estimate signal subspace
-            Es, En, ws, wn = self._subspace_decomposition(C_hat[j,:,:])
+            Es, ws, wn = Es_all[j], ws_all[j], wn_all[j]
             P = (ws-wn[-1])/np.sqrt(ws*wn[-1]+1)
             # form WAVES matrix
             idx1 = j*self.num_src
@@ -7,5 +7,6 @@ sys.path.insert(0,parentdir)
 
 from .dft import *
 from .stft import *
+from .partconv import *
 
 sys.path.append('..') # utils, windows
\ No newline at end of file
@@ -60,6 +60,7 @@ class DFT(object):
         self.freq = np.linspace(0,self.fs/2,self.nbin)
         self.X = np.squeeze(np.zeros((self.nbin,self.D),dtype='complex64'))
         self.x = np.squeeze(np.zeros((self.nfft,self.D),dtype='float32'))
+        self.x_w = np.squeeze(np.zeros((self.nfft,self.D),dtype='float32'))
 
         if analysis_window is not None:
             if self.D==1:
@@ -128,14 +129,15 @@ class DFT(object):
         elif self.D==1:
             if x.ndim!=1 and x.shape[0]!=self.nfft:
                 raise ValueError('Invalid input dimensions.')
-        # apply window if needed
+        # apply window if needed, out of place as x can be a view on the
+        # caller's state (e.g. the overlapping samples of the STFT)
         if self.analysis_window is not None:
-            try:
-                np.multiply(self.analysis_window, x, x)
-            except:
+            if self.x_w.dtype != x.dtype:
                 self.analysis_window = self.analysis_window.astype(x.dtype, 
                     copy=False)
-                np.multiply(self.analysis_window, x, x)
+                self.x_w = self.x_w.astype(x.dtype)
+            np.multiply(self.analysis_window, x, self.x_w)
+            x = self.x_w
         # apply DFT
         if self.transform == 'fftw':
             self.a[:,] = x
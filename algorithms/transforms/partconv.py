@@ -0,0 +1,132 @@
+"""Class for real-time convolution with long filters, using uniformly
+partitioned overlap-save."""
+from __future__ import division
+
+import numpy as np
+from stft import _rfft, _irfft
+
+class PartitionedConvolution:
+    """
+    Filter a stream with long FIR filters, with a latency of one block.
+
+    The filters are split into P blocks of B taps, each transformed with a
+    DFT of size 2B. The spectra of the P last input blocks are kept in a
+    frequency-domain delay line, and each output block is obtained with one
+    DFT per input channel, P complex products per frequency bin and one
+    inverse DFT per output channel (overlap-save). Compared to a single
+    zero-padded DFT (STFT.set_filter), the DFT size only depends on the block
+    size, not on the length of the filters.
+
+    Methods
+    --------
+    process(x)
+        Filter new samples.
+    set_filter(h)
+        Set the filters.
+    reset()
+        Reset the state variables.
+    """
+    def __init__(self, h, B, transform='numpy'):
+        """
+        Constructor for PartitionedConvolution class.
+        Parameters
+        -----------
+        h : numpy array
+            Filters in time domain: (L,) for one channel, (L, D) for one
+            filter per channel, or (L, D_out, D_in) for a MIMO filter matrix,
+            where output o is the sum over the inputs i of h[:,o,i] * x[:,i].
+        B : int
+            Block size: number of samples per block and number of taps per
+            partition of the filters.
+        transform : str
+            'numpy', 'mkl' or 'fftw' to use the appropriate library.
+        """
+        self.B = B
+        self.nfft = 2*B
+        self.nbin = B + 1
+        self.transform = transform
+        self.set_filter(h)
+
+    def set_filter(self, h):
+        """
+        Set the filters, and reset the state variables.
+        Parameters
+        -----------
+        h : numpy array
+            Filters in time domain, of size (L,), (L, D) or (L, D_out, D_in).
+        """
+        h = np.asarray(h, dtype=np.float32)
+        self.mimo = h.ndim == 3
+        self.mono = h.ndim == 1
+        if self.mono:
+            h = h[:,np.newaxis]
+        if self.mimo:
+            self.D_out, self.D_in = h.shape[1:]
+        else:
+            self.D_out = self.D_in = h.shape[1]
+
+        # split the filters in P partitions of B taps
+        self.P = int(np.ceil(h.shape[0] / self.B))
+        parts = np.zeros((self.P*self.B,) + h.shape[1:], dtype=np.float32)
+        parts[:h.shape[0]] = h
+        parts = parts.reshape((self.P, self.B) + h.shape[1:])
+        # (P, [D_out,] D, 2B) zero-padded, so that the DFT is along the last axis
+        parts = np.moveaxis(parts, 1, -1)
+        parts = np.concatenate((parts, np.zeros_like(parts)), axis=-1)
+        self.H = _rfft(parts, self.transform).astype(np.complex64)
+
+        self.reset()
+
+    def reset(self):
+        """
+        Reset state variables.
+        """
+        # the previous and current input blocks
+        self.fft_in_buffer = np.zeros((self.D_in, self.nfft), dtype=np.float32)
+        # frequency-domain delay line, stored twice so that the P last spectra
+        # are always a contiguous slice fdl[pos:pos+P], most recent first
+        self.fdl = np.zeros((2*self.P, self.D_in, self.nbin), dtype=np.complex64)
+        self.pos = 0
+
+    def process(self, x):
+        """
+        Filter new samples.
+        Parameters
+        -----------
+        x : numpy array
+            [k*self.B] new samples, of size (k*self.B,) or (k*self.B, D_in).
+        Returns
+        -----------
+        y : numpy array
+            Filtered samples, of size (k*self.B,) or (k*self.B, D_out).
+        """
+        if x.shape[0] % self.B != 0:
+            raise ValueError('The number of samples must be a multiple of the block size.')
+        k = x.shape[0] // self.B
+        x = x.reshape(k, self.B, self.D_in)
+        y = np.zeros((k, self.B, self.D_out), dtype=np.float32)
+
+        for j in range(k):
+            # overlap-save: the DFT of the previous and the current block
+            self.fft_in_buffer[:,:self.B] = self.fft_in_buffer[:,self.B:]
+            self.fft_in_buffer[:,self.B:] = x[j].T
+            X = _rfft(self.fft_in_buffer, self.transform)
+
+            self.pos = (self.pos - 1) % self.P
+            self.fdl[self.pos] = X
+            self.fdl[self.pos+self.P] = X
+            fdl = self.fdl[self.pos:self.pos+self.P]
+
+            # sum over the partitions (and the inputs) of the products of spectra
+            if self.mimo:
+                Y = np.einsum('poif,pif->of', self.H, fdl)
+            else:
+                Y = np.einsum('pdf,pdf->df', self.H, fdl)
+
+            # only the last B samples are free of circular aliasing
+            y[j] = _irfft(Y, self.nfft, self.transform)[:,self.B:].T
+
+        y = y.reshape(k*self.B, self.D_out)
+        if self.mono:
+            y = y[:,0]
+        return y
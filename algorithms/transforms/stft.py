@@ -5,7 +5,8 @@
 from __future__ import division
 
 import numpy as np
-from dft import DFT
+from numpy.lib.stride_tricks import as_strided
+from dft import DFT, pyfftw_available, mkl_available
 import warnings
 import windows
 
@@ -18,17 +19,30 @@ except ImportError:
 if matplotlib_available:
     import matplotlib.pyplot as plt
 
+if pyfftw_available:
+    import pyfftw.interfaces.numpy_fft
+
+if mkl_available:
+    import mkl_fft
+
 class STFT:
     """
     Methods
     --------
     analysis(x_n)
         Perform STFT on most recent samples.
+    analysis_multiple(x)
+        Perform STFT on a block of new samples, all the frames at once.
     process(h)
         Perform filtering in frequency domain.
+    process_multiple(X)
+        Perform filtering in frequency domain on several frames.
     synthesis()
         Transform to time domain and use overlap-and-add to reconstruct the 
         output.
+    synthesis_multiple(X)
+        Transform several frames to time domain and use overlap-and-add to
+        reconstruct the output, all the frames at once.
     set_filter(h, zb, zf)
         Set time-domain filter with appropriate zero-padding.
     get_prev_samples()
@@ -200,7 +214,8 @@ class STFT:
         """
         Set time-domain filter with appropriate zero-padding.
         Frequency spectrum of the filter is computed and set for the object. 
-        There is also a check for sufficient zero-padding.
+        There is also a check for sufficient zero-padding. For filters much
+        longer than the frames, PartitionedConvolution avoids the large DFT.
         Parameters
         -----------
         coeff : numpy array 
@@ -261,6 +276,43 @@ class STFT:
 
         # self.num_frames += 1
 
+    def analysis_multiple(self, x):
+        """
+        Transform a block of new samples to STFT domain, all the frames at once.
+        This is equivalent to calling analysis on each hop of the block, but
+        the frames are taken without copy and transformed with a single FFT.
+        Parameters
+        -----------
+        x : numpy array
+            [k*self.hop] new samples, of size (k*self.hop,) or (k*self.hop, D).
+        Returns
+        -----------
+        X : numpy array
+            Frequency spectrum of the k frames, of size (k, nbin) or (k, nbin, D).
+        """
+        if x.shape[0] % self.hop != 0:
+            raise ValueError('The number of samples must be a multiple of the hop size.')
+
+        # the previous samples of the first frame, followed by the new ones
+        x = np.concatenate((self.x_p, x), axis=0)
+
+        if self.analysis_window is not None:
+            window = self.analysis_window[self.zf:self.zf+self.N]
+        else:
+            window = None
+        X = stft_analysis(x, self.N, self.hop, analysis_window=window,
+                zf=self.zf, zb=self.zb, transform=self.dft.transform)
+        X = np.transpose(X, (2, 1, 0))
+        if self.D == 1:
+            X = X[:,:,0]
+
+        # update state variables
+        if self.n_state > 0:
+            self.x_p[:] = x[-self.n_state:]
+        self.X[:] = X[-1]
+
+        return X
+
     def process(self):
         """
         Apply filtering in STFT domain.
@@ -274,6 +326,24 @@ class STFT:
         else:
             np.multiply(self.X, self.H, self.X)
 
+    def process_multiple(self, X):
+        """
+        Apply filtering in STFT domain to several frames, in place.
+        Parameters
+        -----------
+        X : numpy array
+            Frequency spectrum of k frames, of size (k, nbin) or (k, nbin, D).
+        Returns
+        -----------
+        X : numpy array
+            Filtered frequency spectrum of the frames.
+        """
+        if self.H is None:
+            warnings.warn("No filter given to the STFT object.")
+        else:
+            np.multiply(X, self.H, X)
+        self.X[:] = X[-1]
+        return X
 
     def synthesis(self):
         """
@@ -304,6 +374,44 @@ class STFT:
 
         return self.out
 
+    def synthesis_multiple(self, X):
+        """
+        Transform several frames to time domain and reconstruct the output
+        with overlap-and-add. This is equivalent to calling synthesis on each
+        frame, with a single inverse FFT and a vectorized overlap-and-add.
+        Parameters
+        -----------
+        X : numpy array
+            Frequency spectrum of k frames, of size (k, nbin) or (k, nbin, D).
+        Returns
+        -----------
+        out: numpy array
+            Reconstructed array of samples of length [k*self.hop]
+        """
+        if self.zb > self.hop:
+            raise ValueError('The zero-padding at the back cannot be longer than the hop size.')
+        if X.ndim == 2:
+            X = X[:,:,np.newaxis]
+        k = X.shape[0]
+
+        # apply IDFT to all the frames, of size (k, nfft, D)
+        x = _irfft(X, self.nfft, self.dft.transform)
+        if self.synthesis_window is not None:
+            x *= self.synthesis_window[:,np.newaxis]
+
+        # reconstruct output: the zb last samples of each frame are added
+        # at the beginning of the next one
+        out = x[:,:self.hop,:]
+        if self.zb > 0:
+            out[0,:self.zb,:] += self.y_p.reshape(self.zb, -1)
+            out[1:,:self.zb,:] += x[:-1,-self.zb:,:]
+            # update state variables
+            self.y_p[:] = x[-1,-self.zb:,:].reshape(self.y_p.shape)
+
+        out = out.reshape(k*self.hop, -1)
+        if self.D == 1:
+            out = out[:,0]
+        return out
 
     def get_prev_samples(self):
         """
@@ -396,3 +504,78 @@ class STFT:
     #         utils.plot_time(x[0:num_frames*self.hop],fs=self.fs)
     #     self.reset()
 
+
+def stft_analysis(x, N, hop, analysis_window=None, zf=0, zb=0, transform='numpy'):
+    """
+    STFT of a whole block of samples. The overlapping frames are taken with
+    strides (without copying the samples), windowed, and transformed with a
+    single FFT call.
+    Parameters
+    -----------
+    x : numpy array
+        Samples, of size (L,) or (L, M) for M channels.
+    N : int
+        Number of samples per frame.
+    hop : int
+        Hop size.
+    analysis_window : numpy array
+        Window of length N applied to each frame. Default is rectangular.
+    zf : int
+        Amount of zero-padding added to front/beginning of each frame.
+    zb : int
+        Amount of zero-padding added to back/end of each frame.
+    transform : str
+        'numpy', 'mkl' or 'fftw' to use the appropriate library.
+    Returns
+    -----------
+    X : numpy array
+        Frequency spectrum of the frames, of size (M, nbin, J) with
+        nbin = (N+zf+zb)//2+1 and J = (L-N)//hop+1 frames.
+    """
+    x = np.asarray(x)
+    if x.ndim == 1:
+        x = x[:,np.newaxis]
+    L, M = x.shape
+    if L < N:
+        raise ValueError('Not enough samples for one frame.')
+    J = (L - N) // hop + 1
+    nfft = N + zf + zb
+
+    # (M, J, N) view on the overlapping frames
+    frames = as_strided(x, shape=(M, J, N),
+            strides=(x.strides[1], hop*x.strides[0], x.strides[0]))
+
+    # windowed and zero-padded frames, float32 for speed!
+    fft_in = np.zeros((M, J, nfft), dtype=np.float32)
+    if analysis_window is not None:
+        np.multiply(frames, analysis_window, out=fft_in[:,:,zf:zf+N])
+    else:
+        fft_in[:,:,zf:zf+N] = frames
+
+    return np.swapaxes(_rfft(fft_in, transform), 1, 2)
+
+def _rfft(x, transform):
+    """
+    Real DFT along the last axis, with the library chosen by transform.
+    """
+    if transform == 'mkl' and mkl_available:
+        return mkl_fft.rfft(x, axis=-1)
+    elif transform == 'fftw' and pyfftw_available:
+        return pyfftw.interfaces.numpy_fft.rfft(x, axis=-1)
+    else:
+        if transform != 'numpy':
+            warnings.warn("Could not import %s wrapper. Using numpy's rfft instead." % transform)
+        return np.fft.rfft(x, axis=-1)
+
+def _irfft(X, n, transform):
+    """
+    Inverse real DFT of length n along axis 1, with the library chosen by transform.
+    """
+    if transform == 'mkl' and mkl_available:
+        return mkl_fft.irfft(X, n, axis=1)
+    elif transform == 'fftw' and pyfftw_available:
+        return pyfftw.interfaces.numpy_fft.irfft(X, n, axis=1)
+    else:
+        if transform != 'numpy':
+            warnings.warn("Could not import %s wrapper. Using numpy's irfft instead." % transform)
+        return np.fft.irfft(X, n, axis=1)
@@ -5,6 +5,7 @@ import numpy as np
 from scipy.signal import fftconvolve
 import warnings
 import transforms.dft as dft
+from transforms.stft import stft_analysis
 
 try:
     import matplotlib as mpl
@@ -105,14 +106,10 @@ def gen_far_field_ir(doa, L, fs, c, frac_delay):
     return fb
 
 def compute_snapshot_spec(signals, N, J, hop, transform='numpy'):
-    nbin = N/2+1
-    M = signals.shape[1]
-    X = np.zeros([M,nbin,J],dtype=complex)
-    d = dft.DFT(N,M, transform=transform)
-    for j in range(J):
-        x, _ = select_slice(signals, j*hop, N)
-        X[:,:,j] = d.analysis(x).T / float(N)
-    return X
+    if signals.shape[0] < (J-1)*hop+N:
+        raise ValueError('The signals are too short for %d snapshots.' % J)
+    # all the J snapshots are computed at once, of size (M, nbin, J)
+    return stft_analysis(signals[:(J-1)*hop+N], N, hop, transform=transform) / float(N)
 
 def select_slice(x, start_sample, num_samples, fs=1.0):
     start_sample = int(start_sample)
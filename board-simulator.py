@@ -0,0 +1,172 @@
+#!/usr/local/bin/python
+# Stand-in for the C daemons of the board (browser-wsaudio and browser-wsconfig),
+# to test browserinterface and the webapp without the microphone array.
+#
+# It speaks the same protocol: WSAudio (port 7321) sends the configuration in JSON
+# then the audio buffers (16-bits little-endian integers), and WSConfig (port 7322)
+# receives the new configurations. The audio is generated: sources in the far field
+# of a circular array with one microphone per channel.
+#
+# Usage: python board-simulator.py --rate 48000 --channels 8 --buffer-frames 1024
+from wsgiref.simple_server import make_server
+from ws4py.websocket import WebSocket
+from ws4py.server.wsgirefserver import WSGIServer, WebSocketWSGIRequestHandler
+from ws4py.server.wsgiutils import WebSocketWSGIApplication
+from threading import Thread, Lock
+from Queue import Queue, Full
+import argparse
+import json
+import socket
+import sys
+import time
+import numpy as np
+
+from algorithms.utils import compute_delayed_signals
+
+parser = argparse.ArgumentParser(description='Simulate the audio daemons of the board.')
+parser.add_argument('--rate', type=int, default=48000, help='sampling rate')
+parser.add_argument('--channels', type=int, default=6, help='number of channels (microphones)')
+parser.add_argument('--buffer-frames', type=int, default=4096, help='number of frames per buffer')
+parser.add_argument('--volume', type=int, default=80, help='volume between 0 and 100')
+parser.add_argument('--sources', type=float, nargs='+', default=[60.], help='directions of the sources, in degrees')
+parser.add_argument('--signal', choices=['noise', 'tone'], default='noise', help='signal of the sources')
+parser.add_argument('--frequency', type=float, default=1000., help='frequency of the tones')
+parser.add_argument('--snr', type=float, default=10., help='signal to noise ratio in dB')
+parser.add_argument('--radius', type=float, default=0.0625, help='radius of the array in meters')
+parser.add_argument('--duration', type=float, default=2., help='duration of the generated audio, played in loop, in seconds')
+parser.add_argument('--backlog', type=int, default=16, help='number of buffers waiting for a slow client before they are dropped')
+args = parser.parse_args()
+
+possible_rates = [8000, 16000, 22050, 32000, 44100, 48000, 96000]
+possible_channels = [1, 2, 4, 6, 8, 16, 32, 48]
+
+config = {'buffer_frames': args.buffer_frames, 'rate': args.rate, 'channels': args.channels, 'volume': args.volume}
+# The generated audio, one message per buffer
+buffers = []
+# Protects config and buffers
+lock = Lock()
+
+# Connected WSAudio clients
+clients = []
+clients_lock = Lock()
+
+def generate(config):
+    rate = config['rate']
+    channels = config['channels']
+    buffer_frames = config['buffer_frames']
+    n_buffers = max(int(args.duration*rate/buffer_frames), 1)
+    length = n_buffers*buffer_frames
+
+    # circular array, one microphone per channel
+    angles = 2*np.pi*np.arange(channels)/channels
+    L = args.radius*np.array([np.cos(angles), np.sin(angles)])
+
+    t = np.arange(length)/float(rate)
+    if args.signal == 'tone':
+        signals = np.array([np.sin(2*np.pi*args.frequency*t + k) for k in range(len(args.sources))]).T
+    else:
+        signals = np.random.randn(length, len(args.sources))
+    x = compute_delayed_signals(L, args.sources, signals, SNR=args.snr, fs=rate)[:, :length]
+
+    # the volume scales the signal, at most to half of the full scale
+    x *= 0.5*32767*config['volume']/100./np.abs(x).max()
+    x = np.array(x.T, dtype='<i2')
+    return [x[i*buffer_frames:(i+1)*buffer_frames].tobytes() for i in range(n_buffers)]
+
+# Each client has its own queue and thread, so a slow client does not slow down the others
+class AudioClient(WebSocket):
+    def opened(self):
+        self.messages = Queue(args.backlog)
+        self.dropped = 0
+        with lock:
+            self.messages.put((json.dumps(config), False))
+        self.messages.put((json.dumps({'possible_channel': possible_channels, 'possible_rates': possible_rates}), False))
+        with clients_lock:
+            clients.append(self)
+        print "New audio client,", len(clients), "connected"
+        sender = Thread(target = self.send_messages)
+        sender.daemon = True
+        sender.start()
+
+    def push(self, message, binary):
+        try:
+            self.messages.put_nowait((message, binary))
+        except Full:
+            self.dropped += 1
+
+    def send_messages(self):
+        while True:
+            message, binary = self.messages.get()
+            try:
+                self.send(message, binary)
+            except (socket.error, IOError):
+                break
+        self.remove()
+
+    def closed(self, code, reason=None):
+        self.remove()
+
+    def remove(self):
+        with clients_lock:
+            if self in clients:
+                clients.remove(self)
+                print "Audio client left (%d buffers dropped), %d connected" % (self.dropped, len(clients))
+
+# New configurations
+class ConfigClient(WebSocket):
+    def received_message(self, message):
+        global config, buffers
+        try:
+            new_config = json.loads(message.data)
+            new_config = dict((k, int(new_config[k])) for k in ['buffer_frames', 'rate', 'channels', 'volume'])
+        except (ValueError, KeyError), e:
+            print "Invalid configuration:", message.data
+            return
+        print "New configuration:", new_config
+        new_buffers = generate(new_config)
+        with lock:
+            config = new_config
+            buffers = new_buffers
+            with clients_lock:
+                for c in clients:
+                    c.push(json.dumps(config), False)
+
+# Send the buffers at the pace of the audio, to all the clients
+def stream():
+    i = 0
+    next_time = time.time()
+    while True:
+        with lock:
+            message = buffers[i % len(buffers)]
+            next_time += config['buffer_frames']/float(config['rate'])
+            with clients_lock:
+                for c in clients:
+                    c.push(message, True)
+        i += 1
+        delay = next_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1:
+            # we are too late (or the configuration changed), start again from now
+            next_time = time.time()
+
+def start_server(port, handler):
+    server = make_server('', port, server_class=WSGIServer,
+                         handler_class=WebSocketWSGIRequestHandler,
+                         app=WebSocketWSGIApplication(handler_cls=handler))
+    server.initialize_websockets_manager()
+    serverThread = Thread(target = server.serve_forever)
+    serverThread.daemon = True
+    serverThread.start()
+    return server
+
+buffers = generate(config)
+start_server(7321, AudioClient)
+start_server(7322, ConfigClient)
+print "Simulating the board:", config
+
+try:
+    stream()
+except KeyboardInterrupt:
+    print 'Exiting...'
+    sys.exit(0)
@@ -5,34 +5,156 @@ from wsgiref.simple_server import make_server
 from ws4py.websocket import WebSocket
 from ws4py.server.wsgirefserver import WSGIServer, WebSocketWSGIRequestHandler
 from ws4py.server.wsgiutils import WebSocketWSGIApplication
-from threading import Thread
-from Queue import Queue
+from threading import Thread, Lock, Condition, Semaphore, Event, local
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty
+from collections import deque
+from functools import partial
 import os
 import json
 import sys
 import socket
 import json
-import datetime
 import time
+import traceback
+import cPickle as pickle
 import numpy as np
 
+try:
+    from scipy.io import wavfile
+    wavfile_available = True
+except ImportError:
+    wavfile_available = False
+
+# Clock used to time the processing stages
+try:
+    from time import monotonic as clock
+except ImportError:
+    clock = time.time
+
 bi_board_ip = None
+# Set when the board IP is known
+bi_board_ready = Event()
 
-# Buffer for audio reception
+# Buffer for audio reception (the last received buffer, read-only)
 bi_buffer = 0
 
+# Number of preallocated audio buffers in the reception ring
+ring_size = 8
+
 # Represent the browser
 client = -1
 
+# Connection to WSAudio
+bi_stream_client = None
+
 # If the module is used from an external script which doesn't need the browser,
 # set it to False.
 inform_browser = True
 
-# Messages to send
+# Messages to send, with the timing of the frame which produced them (or None)
+# A message is a JSON string, or a (JSON header, binary payload) pair
 r_messages = Queue()
+# Hold while sending to the browser, so audio never comes between a header and its payload
+bi_send_lock = Lock()
+
+# Maximum number of audio buffers waiting for the data callback (0: no limit)
+# With ring_size buffers, one is received and one processed while the others wait
+queue_size = 6
+# What to do with a new audio buffer when the queue is full:
+#  'drop-oldest': the oldest waiting buffer is discarded
+#  'drop-newest': the new buffer is discarded
+#  'coalesce': all the waiting buffers are discarded, only the newest is kept
+#  'block': the reception of audio waits until a buffer has been processed
+queue_policy = 'drop-oldest'
+
+# Number of workers running the data callback in parallel
+# (0: the data callback is run by loop_callbacks, one buffer at a time)
+workers = 0
+# 'thread' or 'process': the kind of workers used when workers > 0
+worker_mode = 'thread'
+# If True, the messages sent by the data callbacks running in the workers are
+# sent in the order of the audio buffers
+ordered = True
+# With 'process' workers, a buffer whose result has not arrived after this
+# many seconds is given up (e.g. its worker died), with an empty result
+worker_timeout = 10.
+
+# Queue of callbacks. Only audio buffers can be dropped when the queue is full,
+# the other callbacks (configuration, recordings) are always kept.
+class CallbackQueue():
+    def __init__(self):
+        self.calls = deque()
+        self.num_frames = 0
+        self.cond = Condition()
+        self.dropped = 0
+        self.processed = 0
+
+    # on_drop: only for audio buffers, function called if the buffer is discarded
+    # policy: overrides queue_policy for this buffer
+    def put(self, call, on_drop=None, policy=None):
+        if policy is None:
+            policy = queue_policy
+        with self.cond:
+            if on_drop is not None:
+                if policy == 'coalesce':
+                    self.drop_frames(self.num_frames)
+                elif queue_size > 0 and self.num_frames >= queue_size:
+                    if policy == 'drop-newest':
+                        self.dropped += 1
+                        on_drop()
+                        return
+                    elif policy == 'block':
+                        while self.num_frames >= queue_size:
+                            self.cond.wait()
+                    else:
+                        self.drop_frames(self.num_frames - queue_size + 1)
+                self.num_frames += 1
+            self.calls.append((call, on_drop))
+            self.cond.notify_all()
+
+    # Discard the n oldest audio buffers
+    def drop_frames(self, n):
+        i = 0
+        while n > 0 and i < len(self.calls):
+            on_drop = self.calls[i][1]
+            if on_drop is None:
+                i += 1
+                continue
+            del self.calls[i]
+            self.num_frames -= 1
+            self.dropped += 1
+            on_drop()
+            n -= 1
+
+    def get(self):
+        with self.cond:
+            while len(self.calls) == 0:
+                self.cond.wait()
+            call, on_drop = self.calls.popleft()
+            if on_drop is not None:
+                self.num_frames -= 1
+                self.processed += 1
+            self.cond.notify_all()
+            return call
+
+    def task_done(self):
+        pass
+
+    def empty(self):
+        return len(self.calls) == 0
+
+    def qsize(self):
+        return len(self.calls)
+
+    def reset_counters(self):
+        with self.cond:
+            self.dropped = 0
+            self.processed = 0
 
 # Callbacks to call
-r_calls = Queue()
+r_calls = CallbackQueue()
 
 # Configuration parameters
 rate = 48000
@@ -46,6 +168,7 @@ valid_num_channels = None
 # Callbacks functions
 handle_data = 0
 when_new_config = 0
+handle_result = 0
 
 def register_handle_data(fn):
     global handle_data
@@ -55,26 +178,131 @@ def register_when_new_config(fn):
     global when_new_config
     when_new_config = fn
 
+# fn is called from loop_callbacks with the value returned by the data callback,
+# in the order of the audio buffers, even if the data callback runs in workers
+def register_handle_result(fn):
+    global handle_result
+    handle_result = fn
+
 
 # Current data handler id
 r_id = 0
 
+# Data handlers by id
+bi_handlers = {}
+# Protects the state of the data handlers, shared with the thread sending to the browser
+bi_handlers_lock = Lock()
+# Rate-limited data handlers with a message waiting for its time to be sent
+bi_delayed = []
+
 class DataHandler():
-    def __init__(self, id):
+    def __init__(self, id, max_fps=None, decimate=1, coalesce=False):
         self.id = id
-
+        self.max_fps = max_fps
+        self.decimate = decimate
+        self.coalesce = coalesce
+        # number of messages sent by the callbacks
+        self.received = 0
+        # with coalesce, the only message waiting to be sent, and whether the
+        # handler is in the messages queue
+        self.pending = None
+        self.queued = False
+        self.last_sent = 0
+
+    # The NumPy arrays contained in data are sent as raw bytes (see encode_arrays)
     def send_data(self, data):
-        r_messages.put(json.dumps({'dataHandler': self.id, 'data': data}))
+        arrays = []
+        data = extract_arrays(data, arrays)
+        if len(arrays) == 0:
+            queue_message('message', json.dumps({'dataHandler': self.id, 'data': data}), self.id)
+        else:
+            header, payload = encode_arrays(arrays)
+            queue_message('message', (json.dumps({'dataHandler': self.id, 'data': data, 'arrays': header}), payload), self.id)
+
+    # Queue an encoded message, applying the update policy of the handler
+    def post(self, message, timing=None):
+        with bi_handlers_lock:
+            self.received += 1
+            if (self.received - 1) % self.decimate != 0:
+                return
+            if not self.coalesce:
+                r_messages.put((message, timing))
+                return
+            # a message not sent yet is replaced by the newer one
+            self.pending = (message, timing)
+            if not self.queued:
+                self.queued = True
+                r_messages.put(self)
+
+    # Called by the sender: returns the message to send now, or None if it is too early
+    def take(self):
+        with bi_handlers_lock:
+            now = time.time()
+            if self.max_fps is not None and now < self.last_sent + 1./self.max_fps:
+                bi_delayed.append(self)
+                return None
+            message = self.pending
+            self.pending = None
+            self.queued = False
+            self.last_sent = now
+            return message
+
+# Array types the browser can read directly (as typed arrays)
+binary_dtypes = ['int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'float32', 'float64']
+
+# Replace the NumPy arrays contained in data by {'__array__': index in arrays}
+def extract_arrays(data, arrays):
+    if isinstance(data, np.ndarray):
+        arrays.append(data)
+        return {'__array__': len(arrays) - 1}
+    elif isinstance(data, dict):
+        return dict((k, extract_arrays(v, arrays)) for k, v in data.items())
+    elif isinstance(data, (list, tuple)):
+        return [extract_arrays(v, arrays) for v in data]
+    return data
+
+# Concatenate the arrays in one little-endian binary payload
+# Each array starts at a multiple of 8 bytes so the browser can map it without copy
+def encode_arrays(arrays):
+    header = []
+    chunks = []
+    offset = 0
+    for a in arrays:
+        if a.dtype == np.bool_:
+            a = a.astype(np.uint8)
+        elif a.dtype.kind in 'iu' and a.dtype.name not in binary_dtypes:
+            a = a.astype(np.float64)
+        elif a.dtype == np.float16:
+            a = a.astype(np.float32)
+        elif a.dtype.name not in binary_dtypes:
+            raise ValueError('Arrays of type %s cannot be sent to the browser' % a.dtype)
+        a = np.ascontiguousarray(a, dtype=a.dtype.newbyteorder('<'))
+        header.append({'dtype': a.dtype.name, 'shape': list(a.shape), 'offset': offset})
+        chunks.append(a.tobytes())
+        offset += a.nbytes
+        padding = -offset % 8
+        chunks.append(b'\0'*padding)
+        offset += padding
+    return header, bytearray(b''.join(chunks))
 
 # name: name of the graph
 # type: type of the graphs: 'base:graph:area', 'base:graph:line', 'base:graph:bar', 'base:graph:scatterplot'
 # parameters: parameters of the graph. Typically: {xName: "name of the x axis", seriesNames: ["serie 1", "serie 2", "serie 3"] }
+# max_fps: maximum number of updates per second sent to the browser (None: no limit)
+# decimate: only one message out of decimate is sent
+# coalesce: if True, a message not sent yet is replaced by the newer one, so a
+#           slow browser or network only delays the display, messages do not pile up.
+#           Only for handlers whose messages replace the whole content (e.g. 'replace'),
+#           the 'add' messages of the graphs would be lost
 # returns: a Graph object
-def add_handler(name, type, parameters):
+def add_handler(name, type, parameters, max_fps=None, decimate=1, coalesce=False):
     global r_id
+    if max_fps is not None and not coalesce:
+        raise ValueError('max_fps can only be used when the messages are coalesced')
     r_id = r_id + 1
-    r_messages.put(json.dumps({'addHandler': name, 'id': r_id, 'type': type, 'parameters': parameters}))
-    return DataHandler(r_id)
+    r_messages.put((json.dumps({'addHandler': name, 'id': r_id, 'type': type, 'parameters': parameters}), None))
+    bi_handlers[r_id] = DataHandler(r_id, max_fps, decimate, coalesce)
+    return bi_handlers[r_id]
 
 
 # The following variables are used to measure the latency
@@ -86,73 +314,406 @@ bi_audio_number = 0
 # Audio recordings
 bi_recordings = []
 
+# Ring of preallocated audio buffers: every received frame is decoded
+# directly into the next slot which no callback is still using
+bi_ring = []
+bi_ring_next = 0
+bi_ring_lock = Lock()
+
+class AudioSlot():
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype=np.int16)
+        # callbacks only get a read-only view on the slot
+        self.view = self.data.view()
+        self.view.flags.writeable = False
+        # number of pending callbacks still using this slot
+        self.users = 0
+
+def allocate_ring(frames, channels):
+    global bi_ring, bi_ring_next
+    with bi_ring_lock:
+        bi_ring = [AudioSlot(frames, channels) for i in range(ring_size)]
+        bi_ring_next = 0
+
+# Reserve the next slot not used by any callback
+# If all of them are in use, a new buffer is allocated outside of the ring
+def acquire_slot(frames, channels):
+    global bi_ring_next
+    with bi_ring_lock:
+        for i in range(len(bi_ring)):
+            slot = bi_ring[(bi_ring_next + i) % len(bi_ring)]
+            if slot.users == 0 and slot.data.shape == (frames, channels):
+                bi_ring_next = (bi_ring_next + i + 1) % len(bi_ring)
+                slot.users = 1
+                return slot
+    slot = AudioSlot(frames, channels)
+    slot.users = 1
+    return slot
+
+def release_slot(slot):
+    with bi_ring_lock:
+        slot.users -= 1
+
+# Call the data callback on a ring slot and give the slot back afterwards
+def process_frame(slot, timing):
+    if bi_pool is not None:
+        measure_latency(dispatch_frame, (slot, timing))
+        return
+    timing.start = clock()
+    bi_worker.frame = timing
+    try:
+        result = measure_latency(handle_data, (slot.view, ))
+    finally:
+        bi_worker.frame = None
+        timing.end = clock()
+        release_slot(slot)
+    frame_done(timing)
+    if handle_result != 0:
+        handle_result(result)
+
+
+# Workers running the data callback
+bi_pool = None
+## Limits the number of buffers given to the workers and not processed yet,
+## so the callback queue (and its policy) still applies
+bi_pool_slots = None
+## Frame number of the next buffer given to the workers
+bi_seq_dispatch = 0
+## Frame number of the next result to send, and results arrived too early
+bi_seq_result = 0
+bi_results = {}
+bi_results_lock = Lock()
+## Buffers given to the workers, by frame number: slot, timing and dispatch time
+bi_pending = {}
+## Thread giving up the buffers lost by the process workers
+bi_watchdog = None
+## Messages sent by a data callback running in a worker
+bi_worker = local()
+
+# Messages sent from a worker are kept with the result of the data callback,
+# so they can be re-sequenced, instead of being sent directly
+def queue_message(kind, message, handler=None):
+    messages = getattr(bi_worker, 'messages', None)
+    if messages is not None:
+        messages.append((kind, message, handler))
+    elif kind == 'audio':
+        send_audio(message)
+    elif handler is not None:
+        bi_handlers[handler].post(message, getattr(bi_worker, 'frame', None))
+    else:
+        r_messages.put((message, getattr(bi_worker, 'frame', None)))
+
+def start_workers():
+    global bi_pool, bi_pool_slots, bi_watchdog
+    if bi_pool is not None:
+        # wait for the buffers being processed
+        bi_pool.close()
+        bi_pool.join()
+    bi_pool_slots = Semaphore(2*workers)
+    if worker_mode == 'process':
+        bi_pool = Pool(workers)
+        if bi_watchdog is None:
+            bi_watchdog = Thread(target = watch_workers)
+            bi_watchdog.daemon = True
+            bi_watchdog.start()
+    else:
+        bi_pool = ThreadPool(workers)
+
+# Run in a worker: returns the result of the data callback with the messages it sent,
+# and when the callback started and ended
+# A process worker pickles them itself, so a result that cannot be pickled is
+# replaced by an empty one instead of being lost by the pool
+def run_worker(seq, buffer, pickled=False):
+    bi_worker.messages = []
+    start = clock()
+    try:
+        result = handle_data(buffer)
+    except Exception:
+        traceback.print_exc()
+        result = None
+    end = clock()
+    payload = (result, bi_worker.messages)
+    bi_worker.messages = None
+    if pickled:
+        try:
+            payload = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            traceback.print_exc()
+            payload = pickle.dumps((None, []), pickle.HIGHEST_PROTOCOL)
+    return seq, payload, pickled, start, end
+
+def dispatch_frame(slot, timing):
+    global bi_seq_dispatch
+    bi_pool_slots.acquire()
+    seq = bi_seq_dispatch
+    bi_seq_dispatch += 1
+    with bi_results_lock:
+        bi_pending[seq] = (slot, timing, clock())
+    bi_pool.apply_async(run_worker, (seq, slot.view, worker_mode == 'process'), callback=worker_done)
+
+# Called in the pool thread collecting the results
+def worker_done(res):
+    seq, payload, pickled, start, end = res
+    try:
+        if pickled:
+            payload = pickle.loads(payload)
+        result, messages = payload
+    except Exception:
+        traceback.print_exc()
+        result, messages = None, []
+    finish_frame(seq, result, messages, start, end)
+
+# Give the slot of a buffer back and send its result, exactly once per frame number,
+# whether the worker returned or the buffer was given up
+def finish_frame(seq, result, messages, start=None, end=None):
+    global bi_seq_result
+    with bi_results_lock:
+        pending = bi_pending.pop(seq, None)
+    if pending is None:
+        # already given up
+        return
+    slot, timing, dispatched = pending
+    release_slot(slot)
+    bi_pool_slots.release()
+    if start is not None:
+        timing.start, timing.end = start, end
+        frame_done(timing)
+    res = (seq, result, messages, timing)
+    with bi_results_lock:
+        if not ordered:
+            send_result(res)
+            return
+        bi_results[seq] = res
+        while bi_seq_result in bi_results:
+            send_result(bi_results.pop(bi_seq_result))
+            bi_seq_result += 1
+
+# Give up the buffers whose process worker did not answer in time: the pool
+# never calls back for a job lost with its process
+def watch_workers():
+    while True:
+        time.sleep(min(1., worker_timeout))
+        now = clock()
+        with bi_results_lock:
+            lost = [seq for seq, pending in bi_pending.items()
+                    if now - pending[2] > worker_timeout]
+        for seq in sorted(lost):
+            print("Frame %d: no result from the workers after %g s, giving up" % (seq, worker_timeout))
+            finish_frame(seq, None, [])
+
+def send_result(res):
+    seq, result, messages, timing = res
+    bi_worker.frame = timing
+    try:
+        for kind, message, handler in messages:
+            queue_message(kind, message, handler)
+    except Exception:
+        # the next results must still be sent
+        traceback.print_exc()
+    finally:
+        bi_worker.frame = None
+    if handle_result != 0:
+        r_calls.put((handle_result, (result, )))
+
+# Wait for the buffers given to the workers
+def wait_workers():
+    if bi_pool is not None:
+        for i in range(2*workers):
+            bi_pool_slots.acquire()
+        for i in range(2*workers):
+            bi_pool_slots.release()
+
+# The worker processes are started again after a new configuration,
+# so they see the state set by the configuration callback
+def apply_new_config(*config):
+    if when_new_config != 0:
+        when_new_config(*config)
+    if bi_pool is not None and worker_mode == 'process':
+        start_workers()
+
 # duration in ms
 def record_audio(duration, callback):
     global bi_recordings
-    bi_recordings.append({'duration': duration, 'callback': callback, 'buffer': np.empty([0, channels], dtype=np.int16), 'ended': False})
+    recording = {'duration': duration, 'callback': callback, 'ended': False}
+    allocate_recording(recording)
+    bi_recordings.append(recording)
+
+# The whole recording is allocated at once: the requested duration rounded up
+# to a whole number of audio buffers
+def allocate_recording(recording):
+    n_buffers = int(np.ceil(recording['duration']*rate/1000./buffer_frames))
+    recording['buffer'] = np.empty([max(n_buffers, 1)*buffer_frames, channels], dtype=np.int16)
+    recording['filled'] = 0
+
+# Copy a new audio buffer at the end of all the running recordings
+def add_to_recordings(buffer):
+    for recording in bi_recordings:
+        if not recording['ended']:
+            start = recording['filled']
+            n = min(len(buffer), len(recording['buffer']) - start)
+            recording['buffer'][start:start+n] = buffer[:n]
+            recording['filled'] += n
 
 # This method goes through all recordings, and send those which must have finished
 def handle_recordings():
     global bi_recordings, r_calls
     for i in reversed(range(len(bi_recordings))):
         recording = bi_recordings[i]
-        audio_duration = len(recording['buffer'])*1000/rate
-        if audio_duration >= recording['duration']:
+        if recording['filled'] >= len(recording['buffer']):
             recording['ended'] = True
             r_calls.put((recording['callback'], (recording['buffer'], )))
             # recording['callback'](recording['buffer'])
             del bi_recordings[i]
 
+# Timing of the processing stages of each audio buffer (in milliseconds):
+#  'network': delay of the reception, compared to the first buffer received
+#  'decode': from the reception to the callback queue
+#  'queue': waiting in the callback queue (and for a worker)
+#  'process': the data callback
+#  'send': from the end of the callback to the message sent to the browser
+timing_stages = ['network', 'decode', 'queue', 'process', 'send']
+# Number of values per stage over which the statistics are computed
+timing_window = 500
+# Interval in seconds between two statistics sent to the browser (0: never)
+timing_interval = 1.
+
+bi_timing = {}
+bi_timing_lock = Lock()
+bi_timing_sent = 0
+## Date of the first buffer received, and number of buffers received since
+bi_receive_start = None
+bi_receive_number = 0
+
+class FrameTiming():
+    def __init__(self):
+        self.receive = clock()
+        self.enqueue = None
+        self.start = None
+        self.end = None
+
+def reset_timing():
+    global bi_timing, bi_receive_start, bi_receive_number
+    with bi_timing_lock:
+        bi_timing = dict((stage, deque(maxlen=timing_window)) for stage in timing_stages)
+    bi_receive_start = None
+    bi_receive_number = 0
+
+reset_timing()
+
+def record_timing(stage, seconds):
+    with bi_timing_lock:
+        bi_timing[stage].append(seconds*1000)
+
+def frame_received(timing):
+    global bi_receive_start, bi_receive_number
+    if bi_receive_start is None:
+        bi_receive_start = timing.receive
+    record_timing('network', timing.receive - bi_receive_start - bi_receive_number*buffer_frames/float(rate))
+    bi_receive_number += 1
+
+# Called when the data callback of a buffer has returned
+def frame_done(timing):
+    record_timing('decode', timing.enqueue - timing.receive)
+    record_timing('queue', timing.start - timing.enqueue)
+    record_timing('process', timing.end - timing.start)
+
+def message_sent(timing):
+    # a message sent before the end of the callback did not wait
+    if timing.end is not None:
+        record_timing('send', max(clock() - timing.end, 0))
+
+# Statistics of each stage over the last timing_window values, in milliseconds:
+# {'queue': {'count': 500, 'mean': 1.2, 'p50': 1.1, 'p90': 2.0, 'p99': 3.5, 'max': 4.2}, ...}
+def get_latency_stats():
+    with bi_timing_lock:
+        values = dict((stage, np.array(v)) for stage, v in bi_timing.items())
+    stats = {}
+    for stage, v in values.items():
+        if len(v) > 0:
+            p50, p90, p99 = np.percentile(v, [50, 90, 99])
+            stats[stage] = {'count': len(v), 'mean': float(v.mean()), 'p50': float(p50),
+                            'p90': float(p90), 'p99': float(p99), 'max': float(v.max())}
+    return stats
+
 def measure_latency(cb, params):
-    global bi_audio_start, bi_audio_number
+    global bi_audio_start, bi_audio_number, bi_timing_sent
 
     if bi_audio_start == None:
-        bi_audio_start = datetime.datetime.now()
+        bi_audio_start = clock()
 
-    time_diff = datetime.datetime.now() - bi_audio_start
-    time_elapsed = time_diff.total_seconds()*1000 # in milliseconds
-    audio_received = bi_audio_number*buffer_frames*1000/rate
+    time_elapsed = (clock() - bi_audio_start)*1000 # in milliseconds
+    # the dropped buffers were received too
+    audio_received = (bi_audio_number + r_calls.dropped)*buffer_frames*1000./rate
     audio_delay = time_elapsed - audio_received
-    r_messages.put(json.dumps({'latency': audio_delay}))
+    r_messages.put((json.dumps({'latency': audio_delay, 'dropped': r_calls.dropped, 'processed': r_calls.processed}), None))
     bi_audio_number += 1
 
+    if timing_interval > 0 and clock() - bi_timing_sent >= timing_interval:
+        bi_timing_sent = clock()
+        r_messages.put((json.dumps({'timing': get_latency_stats()}), None))
+
     # We call the callback
-    cb(*params)
+    return cb(*params)
+
+# A new audio configuration, from WSAudio or a replay
+def receive_config(new_rate, new_channels, new_buffer_frames, new_volume):
+    global bi_audio_start, bi_audio_number, bi_buffer
+    global rate, channels, buffer_frames, volume
+
+    bi_audio_start = None
+    bi_audio_number = 0
+    r_calls.reset_counters()
+    reset_timing()
+
+    rate = new_rate
+    channels = new_channels
+    buffer_frames = new_buffer_frames
+    volume = new_volume
+
+    allocate_ring(buffer_frames, channels)
+    bi_buffer = bi_ring[0].view
+    for recording in bi_recordings:
+        allocate_recording(recording)
+
+    r_calls.put((apply_new_config, (buffer_frames, rate, channels, volume)))
+
+# A new audio buffer, from WSAudio or a replay: data contains the int16 samples,
+# frame after frame
+# realtime: False when the buffers come as fast as they are processed (replay),
+# the reception then waits for the callbacks instead of dropping buffers
+def receive_audio(data, realtime=True):
+    global bi_buffer
+
+    timing = FrameTiming()
+    if realtime:
+        frame_received(timing)
+
+    # Copy the data once, into a free slot of the ring
+    slot = acquire_slot(data.size // channels, channels)
+    slot.data[:] = data.reshape(slot.data.shape)
+    bi_buffer = slot.view
+
+    # We add the new data to the recordings
+    add_to_recordings(bi_buffer)
+    handle_recordings()
+
+    # We call the potential callback, which releases the slot when done
+    if handle_data != 0:
+        timing.enqueue = clock()
+        r_calls.put((process_frame, (slot, timing)), on_drop=partial(release_slot, slot),
+                    policy=None if realtime else 'block')
+    else:
+        release_slot(slot)
 
 # Connection with WSAudio
 class StreamClient(WebSocketClient):
     def received_message(self, m):
-        global bi_audio_start
-        global bi_audio_number
-        global bi_recordings
-        global bi_buffer
-        global r_calls
-
         if not m.is_binary: # configuration data
 
             m = json.loads(m.data)
 
             try:
-
-                global rate
-                global channels
-                global buffer_frames
-                global volume
-
-                bi_audio_start = None
-                bi_audio_number = 0
-
-                rate = m['rate']
-                channels = m['channels']
-                buffer_frames = m['buffer_frames']
-                volume = m['volume']
-
-                bi_buffer = np.zeros((buffer_frames, channels), dtype=np.int16)
-                for recording in bi_recordings:
-                    recording['buffer'] = np.empty([0, channels], dtype=np.int16)
-
-                if when_new_config != 0:
-                    r_calls.put((when_new_config, (buffer_frames, rate, channels, volume)))
+                receive_config(m['rate'], m['channels'], m['buffer_frames'], m['volume'])
 
             except:
 
@@ -163,34 +724,23 @@ class StreamClient(WebSocketClient):
                 valid_rates = m['possible_rates']
 
         else: # new audio data
-            # We convert the binary stream into a 2D Numpy array of 16-bits integers
-            data = bytearray()
-            data.extend(m.data)
-
-            # replace data in the buffer
-            bi_buffer.data[:] = data[:]
-
-            # We add the new data to the recordings
-            for recording in bi_recordings:
-                if not recording['ended']:
-                    recording['buffer'] = np.concatenate((recording['buffer'], bi_buffer))
-            handle_recordings()
-
-            # We call the potential callback
-            if handle_data != 0:
-                r_calls.put((measure_latency, (handle_data, (bi_buffer, ))))
+            # We map the binary stream onto a Numpy array of 16-bits integers
+            receive_audio(np.frombuffer(m.data, dtype=np.int16))
 
 # Send a new audio buffer to the browser
 def send_audio(buffer):
     global client
-    if client != -1:
+    if getattr(bi_worker, 'messages', None) is not None:
+        queue_message('audio', buffer)
+    elif client != -1:
         try:
             # Convert to numpy array if necessary
             if not isinstance(buffer, np.ndarray) or buffer.dtype != np.int16:
                 buffer = np.array(buffer, dtype=np.int16)
 
             # Send back as a byte array
-            client.send(bytearray(buffer), True)
+            with bi_send_lock:
+                client.send(bytearray(buffer), True)
 
         except socket.error, e:
             print "Error when send_audio: the browser might be disconnected, we remove it"
@@ -219,14 +769,55 @@ def change_config(rate=None, channels=None, buffer_frames=None, volume=None):
     change_config_q.connect()
 
 
+# Wait for the next message to send to the browser
+# The rate-limited data handlers are sent as soon as their time has come
+def next_message():
+    while True:
+        timeout = None
+        with bi_handlers_lock:
+            now = time.time()
+            for handler in bi_delayed:
+                wait = handler.last_sent + 1./handler.max_fps - now
+                if timeout is None or wait < timeout:
+                    timeout = wait
+        if timeout is not None and timeout <= 0:
+            m = None
+        else:
+            try:
+                m = r_messages.get(True, timeout)
+                r_messages.task_done()
+            except Empty:
+                m = None
+        if m is None:
+            # send the first delayed handler which is ready
+            with bi_handlers_lock:
+                now = time.time()
+                ready = [h for h in bi_delayed if now >= h.last_sent + 1./h.max_fps]
+                if len(ready) == 0:
+                    continue
+                bi_delayed.remove(ready[0])
+            m = ready[0]
+        if isinstance(m, DataHandler):
+            m = m.take()
+            if m is None:
+                continue
+        return m
+
 # Connection with the browser
 class WSServer(WebSocket):
     def opened(self):
         global client
         client = self
         while True:
-            self.send(r_messages.get(), False)
-            r_messages.task_done()
+            m, timing = next_message()
+            with bi_send_lock:
+                if isinstance(m, tuple):
+                    self.send(m[0], False)
+                    self.send(m[1], True)
+                else:
+                    self.send(m, False)
+            if timing is not None:
+                message_sent(timing)
 
     def close(self, code, reason):
         global client
@@ -256,7 +847,7 @@ class PythonDaemonClient(WebSocketClient):
         # We should receive the IP address of the board
         bi_board_ip = message.data
         self.close()
-        start_client_thread()
+        bi_board_ready.set()
 
 
 def inform_browser_query():
@@ -275,27 +866,143 @@ def start_client_thread():
     clientThread.daemon = True
     clientThread.start()
 
-def start():
+# Connection to WSAudio, without blocking: the ws4py client already
+# receives the messages in its own thread
+def connect_client():
+    global bi_stream_client
+    bi_stream_client = StreamClient('ws://' + bi_board_ip + ':7321/', protocols=['http-only', 'chat'])
+    bi_stream_client.connect()
+
+def start_server_thread():
     serverThread = Thread(target = start_server, args = (9001, ))
     serverThread.daemon = True
     serverThread.start()
 
+def start():
+    start_server_thread()
+
     if inform_browser:
         # Query the browser for the board address
         inform_browser_query()
 
         # Wait until we get the board IP from the browser
-        while bi_board_ip is None:
-            time.sleep(0.1)
+        # (with a timeout, else Ctrl-C cannot interrupt the wait on Python 2)
+        while not bi_board_ready.wait(0.5):
+            pass
 
     else:
         if bi_board_ip is None:
             raise ValueError('When running without the browser, the board IP needs to be set manually.')
-        start_client_thread()
+
+    connect_client()
+
+# Replay of audio files, instead of the audio of the board
+# Statistics of the last replay, available when it ended:
+#  {'buffers': number of buffers, 'audio': duration of the audio (s),
+#   'duration': time to process it (s), 'speed': audio / duration}
+replay_stats = None
+
+# Read a WAV file (memory-mapped), a raw file of int16 little-endian samples,
+# or an array, as int16 samples of shape (frames, channels)
+def load_replay(source, rate=None, channels=None):
+    if isinstance(source, np.ndarray):
+        samples = source
+    elif source.lower().endswith('.wav'):
+        if not wavfile_available:
+            raise ValueError('scipy is needed to replay WAV files.')
+        rate, samples = wavfile.read(source, mmap=True)
+    else:
+        if channels is None:
+            raise ValueError('The number of channels of a raw file must be given.')
+        samples = np.memmap(source, dtype='<i2', mode='r')
+        samples = samples[:len(samples) // channels * channels].reshape(-1, channels)
+
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    if len(samples) == 0:
+        raise ValueError('The replayed audio contains no frame.')
+    if rate is None:
+        raise ValueError('The rate of the replayed audio must be given.')
+    return rate, samples
+
+# Convert a chunk of samples to int16
+def to_int16(chunk):
+    if chunk.dtype == np.int16:
+        return chunk
+    elif chunk.dtype.kind == 'f':
+        return (np.clip(chunk, -1, 1)*32767).astype(np.int16)
+    elif chunk.dtype == np.uint8:
+        return ((chunk.astype(np.int16) - 128) << 8)
+    else:
+        return (chunk >> (8*chunk.dtype.itemsize - 16)).astype(np.int16)
+
+# Feed the audio of source through the callbacks, like if it came from the board
+# source: name of a WAV file or of a raw file (int16 little-endian), or an array (frames, channels)
+# rate, channels: needed for raw files and arrays
+# buffer_frames: number of frames per buffer (default: the current buffer_frames)
+# realtime: if True, the buffers are given at the pace of the audio, otherwise as fast
+#           as they are processed (no buffer is dropped), to measure the maximum throughput
+# loop: replay the source forever
+# callback: called from loop_callbacks with replay_stats when the replay ended
+# The callbacks are run by loop_callbacks(), as usual
+def start_replay(source, rate=None, channels=None, buffer_frames=None, realtime=True, loop=False, callback=None):
+    rate, samples = load_replay(source, rate, channels)
+    if buffer_frames is None:
+        buffer_frames = globals()['buffer_frames']
+
+    if inform_browser:
+        start_server_thread()
+        inform_browser_query()
+
+    replayThread = Thread(target = replay, args = (samples, rate, buffer_frames, realtime, loop, callback))
+    replayThread.daemon = True
+    replayThread.start()
+
+def replay(samples, rate, buffer_frames, realtime, loop, callback):
+    receive_config(rate, samples.shape[1], buffer_frames, 100)
+    n_buffers = int(np.ceil(len(samples) / float(buffer_frames)))
+    # the last buffer is completed with zeros
+    last = np.zeros((buffer_frames, samples.shape[1]), dtype=np.int16)
+    last[:len(samples) - (n_buffers - 1)*buffer_frames] = to_int16(samples[(n_buffers - 1)*buffer_frames:])
+
+    start = clock()
+    played = 0
+    while True:
+        for i in range(n_buffers):
+            if realtime:
+                delay = start + played*buffer_frames/float(rate) - clock()
+                if delay > 0:
+                    time.sleep(delay)
+            if i < n_buffers - 1:
+                receive_audio(to_int16(samples[i*buffer_frames:(i+1)*buffer_frames]), realtime)
+            else:
+                receive_audio(last, realtime)
+            played += 1
+        if not loop:
+            break
+
+    r_calls.put((replay_ended, (start, played, buffer_frames/float(rate), callback)))
+
+# Called from loop_callbacks after the last buffer of a replay
+def replay_ended(start, played, buffer_duration, callback):
+    global replay_stats
+    wait_workers()
+    duration = clock() - start
+    replay_stats = {'buffers': played, 'audio': played*buffer_duration,
+                    'duration': duration, 'speed': played*buffer_duration/duration}
+    if callback is not None:
+        callback(replay_stats)
 
 def loop_callbacks():
     global r_calls
+    if workers > 0:
+        start_workers()
     while True:
         c = r_calls.get()
         c[0](*c[1])
         r_calls.task_done()
+
+# Start the module and run the callbacks: equivalent to start() followed by loop_callbacks()
+def run():
+    start()
+    loop_callbacks()
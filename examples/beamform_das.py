@@ -64,8 +64,7 @@ def init(buffer_frames, rate, channels, volume):
     # visualization
     freq_viz = 2000 # frequency for which to visualize beam pattern
     beam_shape[:] = bf.get_directivity(freq=freq_viz)
-    beam = beam_shape.tolist()
-    beam.append(beam[0]) # "close" beam shape
+    beam = np.append(beam_shape, beam_shape[0]).astype(np.float32) # "close" beam shape
     polar_chart.send_data([{ 'replace': beam }])
 
     if led_ring:
@@ -93,10 +92,10 @@ def beamform_audio(audio):
     stft.analysis(audio)
     stft.process()
 
-    # send back audio to browser
-    audio[:,0] = np.sum(stft.synthesis(), axis=1)
-    audio[:,1] = audio[:,0]
-    audio[:,2:] = 0
+    # send back audio to browser (the input buffer is read-only)
+    out = np.zeros_like(audio)
+    out[:,0] = np.sum(stft.synthesis(), axis=1)
+    out[:,1] = out[:,0]
 
     # Check time spent on processing
     proc_time = time.time() - start_proc
@@ -108,7 +107,7 @@ def beamform_audio(audio):
         led_ring.lightify(vals=beam_shape)
 
     # Send audio back to the browser
-    browserinterface.send_audio(audio)
+    browserinterface.send_audio(out)
 
 
 """Interface features"""
@@ -117,7 +116,7 @@ browserinterface.register_handle_data(beamform_audio)
 polar_chart = browserinterface.add_handler(name="Beam pattern", 
     type='base:polar:line', 
     parameters={'title': 'Beam pattern', 'series': ['Intensity'], 
-    'numPoints': num_angles} )
+    'numPoints': num_angles}, coalesce=True)
 
 """START"""
 browserinterface.start()
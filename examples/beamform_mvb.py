@@ -81,8 +81,7 @@ def beamform_audio(audio):
 
             # visualize
             beam_shape[:] = bf.get_directivity(freq=freq_viz)
-            beam = beam_shape.tolist()
-            beam.append(beam[0]) # "close" beam shape
+            beam = np.append(beam_shape, beam_shape[0]).astype(np.float32) # "close" beam shape
             polar_chart.send_data([{ 'replace': beam }])
             if led_ring:
                 led_ring.lightify(vals=beam_shape)
@@ -91,11 +90,11 @@ def beamform_audio(audio):
         stft.analysis(audio)
         stft.process()
         
-        # Send audio back to the browser
-        audio[:,0] = np.sum(stft.synthesis(), axis=1)
-        audio[:,1] = audio[:,0]
-        audio[:,2:] = 0
-        browserinterface.send_audio(audio)
+        # Send audio back to the browser (the input buffer is read-only)
+        out = np.zeros_like(audio)
+        out[:,0] = np.sum(stft.synthesis(), axis=1)
+        out[:,1] = out[:,0]
+        browserinterface.send_audio(out)
 
     else: # continue estimating covariance matrix
         bf.estimate_cov(audio)
@@ -108,7 +107,7 @@ browserinterface.register_handle_data(beamform_audio)
 polar_chart = browserinterface.add_handler(name="Beam pattern", 
     type='base:polar:line', 
     parameters={'title': 'Beam pattern', 'series': ['Intensity'], 
-    'numPoints': num_angles} )
+    'numPoints': num_angles}, coalesce=True)
 
 
 """START"""
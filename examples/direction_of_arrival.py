@@ -12,9 +12,11 @@ finding algorithms. Possible algorithms can be selected here:
 """ Select algorithm """
 doa_algo = 'SRPPHAT'
 #doa_algo = 'MUSIC'
+#doa_algo = 'FRIDA'
 doa_algo_config = dict(
         MUSIC=dict(vrange=[0.1, 0.8]),
         SRPPHAT=dict(vrange=[0.1, 0.4]),
+        FRIDA=dict(vrange=[0., 1.]),
         )
 
 """
@@ -33,6 +35,12 @@ n_bands = 20
 freq_range = [1000., 3500.]
 use_bin = True  # use top <n_bands> frequencies (True) or use all frequencies within specified range (False)
 
+"""
+Accumulate the snapshots of successive buffers, with this forgetting factor
+(None to only use the snapshots of the current buffer)
+"""
+forget = None
+
 """
 Read hardware config from file
 """
@@ -118,7 +126,7 @@ def make_colors(powers):
 """Initialization block"""
 print("Using " + doa_algo)
 def init(buffer_frames, rate, channels, volume):
-    global doa
+    global doa, stream
 
     doa_args = {
             'L': mic_array,
@@ -128,7 +136,6 @@ def init(buffer_frames, rate, channels, volume):
             'n_grid': num_angles
             }
 
-    # doa = rt.doa.FRIDA(max_four=2, signal_type='visibility', G_iter=1, **doa_args)
     if doa_algo == 'SRPPHAT':
         doa = rt.doa.SRP(**doa_args)
     elif doa_algo == 'MUSIC':
@@ -139,6 +146,15 @@ def init(buffer_frames, rate, channels, volume):
         doa = rt.doa.WAVES(num_iter=1, **doa_args)
     elif doa_algo == 'TOPS':
         doa = rt.doa.TOPS(**doa_args)
+    elif doa_algo == 'FRIDA':
+        # the random initializations are solved together in this process,
+        # dispatching them to other processes on every buffer would cost more
+        doa = rt.doa.FRIDA(max_four=2, signal_type='visibility', G_iter=1,
+                n_jobs=1, **doa_args)
+
+    stream = None
+    if forget is not None:
+        stream = rt.doa.StreamingDOA(doa, forget=forget)
 
 
 """Callback"""
@@ -160,21 +176,34 @@ def apply_doa(audio):
         n_snapshots, hop_size, transform=transform)
 
     # pick bands with most energy and perform DOA
-    if use_bin:
+    if stream is not None:
+        stream.update(X_stft)
+        if use_bin:
+            freq_bins = np.argsort(stream.power[range_bins])[-n_bands:] + f_min
+            stream.locate_sources(freq_bins=freq_bins)
+        else:
+            stream.locate_sources(freq_range=freq_range)
+    elif use_bin:
         bands_pwr = np.mean(np.sum(np.abs(X_stft[:,range_bins,:])**2, axis=0), axis=1)
         freq_bins = np.argsort(bands_pwr)[-n_bands:] + f_min
         doa.locate_sources(X_stft, freq_bins=freq_bins)
     else:
         doa.locate_sources(X_stft, freq_range=freq_range)
 
+    if doa_algo == 'FRIDA':
+        # FRIDA does not search a grid, mark the directions found instead
+        values = np.zeros(num_angles)
+        values[np.round(doa.azimuth_recon / (2 * np.pi) * num_angles).astype(int) % num_angles] = 1.
+    else:
+        values = doa.grid.values
+
     # send to browser for visualization
-    to_send = doa.grid.values.tolist()
-    to_send.append(to_send[0])
+    to_send = np.append(values, values[0]).astype(np.float32)
     polar_chart.send_data([{ 'replace': to_send }])
 
     # send to lights if available
     if led_ring:
-        make_colors(doa.grid.values)
+        make_colors(values)
         #led_ring.lightify(vals=doa.grid.values, realtime=True)
 
 """Interface features"""
@@ -184,7 +213,7 @@ browserinterface.register_handle_data(apply_doa)
 polar_chart = browserinterface.add_handler(name="Directions", 
     type='base:polar:line', 
     parameters={'title': 'Direction', 'series': ['Intensity'], 
-    'numPoints': num_angles} )
+    'numPoints': num_angles}, coalesce=True)
 
 """START"""
 browserinterface.start()
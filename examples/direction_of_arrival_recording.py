@@ -123,8 +123,7 @@ def apply_doa(audio):
         # send to browser for visualization
         if doa.grid.values.max() > 1:
             doa.grid.values /= doa.grid.values.max()
-        to_send = doa.grid.values.tolist()
-        to_send.append(to_send[0])
+        to_send = np.append(doa.grid.values, doa.grid.values[0]).astype(np.float32)
         polar_chart.send_data([{ 'replace': to_send }])
 
         # send to lights if available
@@ -139,7 +138,7 @@ browserinterface.record_audio(recording_duration*1000, apply_doa)
 polar_chart = browserinterface.add_handler(name="Directions", 
     type='base:polar:line', 
     parameters={'title': 'Direction', 'series': ['Intensity'], 
-    'numPoints': num_angles} )
+    'numPoints': num_angles}, coalesce=True)
 
 """START"""
 browserinterface.start()
@@ -39,9 +39,12 @@ f1, f2 = 2000., 5000.
 fir_coeff = signal.firwin(numtaps, [float(f1)/nrate, float(f2)/nrate], 
     pass_zero=False)
     
-# ideally pick a buffer size so that length of DFT (buffer_size*2) will be power of two
-nfft = 2048
-buffer_size = nfft - numtaps + 1
+# ideally pick a hop size so that length of DFT (hop + numtaps) will be power of two
+nfft = 512
+hop = nfft - numtaps
+# each audio buffer contains several STFT frames, processed all at once
+n_hops = 4
+buffer_size = n_hops*hop
 num_channels = 2
 transform = 'mkl' # 'numpy', 'mlk', 'fftw'
 
@@ -96,8 +99,8 @@ def bin_spectrum(spectrum, bands, output=None):
 def init(buffer_frames, rate, channels, volume):
     global stft
 
-    # create STFT object - buffer size will be our hop size
-    stft = rt.transforms.STFT(buffer_size, rate, hop=buffer_size, 
+    # create STFT object - the filter needs zero padding of numtaps after each hop
+    stft = rt.transforms.STFT(hop, rate, hop=hop, 
         transform=transform)
     stft.set_filter(coeff=fir_coeff, zb=numtaps)
 
@@ -135,21 +138,23 @@ def handle_data(audio):
         print("Did not receive expected audio!")
         return
     
-    stft.analysis(audio[:,0])
+    # all the frames of the buffer at once, the spectra displayed are the last ones
+    X = stft.analysis_multiple(audio[:,0])
     spectrum_before = np.floor(20. * np.log10( np.maximum( 1e-5, np.abs( stft.X ) ) ))
     if viz:
         visualize_spectrum(c_magnitude, spectrum_before)
     
-    stft.process()
+    stft.process_multiple(X)
     spectrum_after = np.floor(20. * np.log10( np.maximum( 1e-5, np.abs( stft.X ) ) ))
     if viz:
         visualize_spectrum(c_magnitude_f, spectrum_after)
 
     # either viz or playback
     if not viz:
-        audio[:,0] = stft.synthesis().astype(audio.dtype)
-        audio[:,1] = audio[:,0]
-        browserinterface.send_audio(audio)
+        out = np.empty_like(audio)
+        out[:,0] = stft.synthesis_multiple(X).astype(audio.dtype)
+        out[:,1] = out[:,0]
+        browserinterface.send_audio(out)
 
     # time plot
     if viz:
@@ -167,8 +172,8 @@ browserinterface.register_when_new_config(init)
 browserinterface.register_handle_data(handle_data)
 if viz:
     time_plot = browserinterface.add_handler("Time domain", 'base:graph:line', {'xName': 'Duration', 'min': -1, 'max': 1, 'xLimitNb': (sampling_freq/under*num_sec), 'series': [{'name': 'Signal', 'color': 'blue'}]})
-    c_magnitude = browserinterface.add_handler("Frequency Magnitude", 'base:graph:line', {'min': 0, 'max': 250, 'xName': 'Frequency', 'series': [{'name': '1'}, {'name': '2'}]})
-    c_magnitude_f = browserinterface.add_handler("Frequency Magnitude (Filtered)", 'base:graph:line', {'min': 0, 'max': 250, 'xName': 'Frequency', 'series': [{'name': '1'}, {'name': '2'}]})
+    c_magnitude = browserinterface.add_handler("Frequency Magnitude", 'base:graph:line', {'min': 0, 'max': 250, 'xName': 'Frequency', 'series': [{'name': '1'}, {'name': '2'}]}, coalesce=True)
+    c_magnitude_f = browserinterface.add_handler("Frequency Magnitude (Filtered)", 'base:graph:line', {'min': 0, 'max': 250, 'xName': 'Frequency', 'series': [{'name': '1'}, {'name': '2'}]}, coalesce=True)
 
 
 """START"""
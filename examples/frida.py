@@ -170,8 +170,7 @@ def apply_doa(audio):
     if led_ring:
         make_colors(doa.azimuth_recon, doa.alpha_recon.mean(axis=1))
 
-    to_send = spatial_spectrum[::-1].tolist()
-    to_send.append(to_send[0])
+    to_send = np.append(spatial_spectrum[::-1], spatial_spectrum[-1]).astype(np.float32)
     polar_chart.send_data([{ 'replace': to_send }])
 
 
@@ -182,7 +181,7 @@ browserinterface.register_handle_data(apply_doa)
 polar_chart = browserinterface.add_handler(name="Directions", 
     type='base:polar:line', 
     parameters={'title': 'Direction', 'series': ['Intensity'], 
-    'numPoints': num_angles} )
+    'numPoints': num_angles}, coalesce=True)
 
 """START"""
 browserinterface.start()
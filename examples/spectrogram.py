@@ -66,7 +66,7 @@ def handle_data(audio):
 
     stft.analysis(audio[:,0])
     spectrum = (20 * np.log10(np.abs(stft.X[:height])))
-    spectrogram.send_data(spectrum.tolist())
+    spectrogram.send_data(spectrum.astype(np.float32))
 
 
     if led_ring:
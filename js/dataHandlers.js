@@ -27,12 +27,56 @@ var dataHandlers = new (function() {
   function addNewData(id, data) {
     list[id].instance.newData(data)
   }
+  // header.data is the data where the arrays are replaced by {__array__: index}
+  // header.arrays gives the dtype, shape and offset of each array in buffer
+  function addNewBinaryData(id, header, buffer) {
+    var arrays = _.map(header.arrays, function (a) {
+      var size = _.reduce(a.shape, function (n, dim) { return n * dim; }, 1);
+      return reshapeArray(new arrayTypes[a.dtype](buffer, a.offset, size), a.shape);
+    });
+    function fill(d) {
+      if (_.isArray(d)) {
+        return _.map(d, fill);
+      } else if (_.isObject(d)) {
+        if (d.__array__ !== undefined) {
+          return arrays[d.__array__];
+        }
+        return _.mapValues(d, fill);
+      }
+      return d;
+    }
+    addNewData(id, fill(header.data));
+  }
+
+  var arrayTypes = {
+    int8: Int8Array,
+    uint8: Uint8Array,
+    int16: Int16Array,
+    uint16: Uint16Array,
+    int32: Int32Array,
+    uint32: Uint32Array,
+    float32: Float32Array,
+    float64: Float64Array
+  };
+  // Multidimensional arrays become arrays of typed arrays (no copy)
+  function reshapeArray(flat, shape) {
+    if (shape.length <= 1) {
+      return flat;
+    }
+    var stride = flat.length / shape[0];
+    var rows = [];
+    for (var i = 0 ; i < shape[0] ; i++) {
+      rows.push(reshapeArray(flat.subarray(i * stride, (i + 1) * stride), shape.slice(1)));
+    }
+    return rows;
+  }
 
   return {
     registerNewType: registerNewType,
     init: init,
     addHandler: addHandler,
-    addNewData: addNewData
+    addNewData: addNewData,
+    addNewBinaryData: addNewBinaryData
   };
 })();
 
@@ -197,7 +241,7 @@ function plotPolarType(type) {
         if (d.append) { // we ca append a new point
           c.data[i].r.push(d.append);
         } else if (d.replace) { // or replace the whole values
-          c.data[i].r = d.replace;
+          c.data[i].r = Array.prototype.slice.call(d.replace);
         }
       });
       m.config(c);
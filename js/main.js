@@ -466,12 +466,16 @@ function displayConfig() {
 
 // Audio latency
 var infosAudioLatency = $('#info-audio-latency');
+var infosAudioDropped = $('#info-audio-dropped');
+var infosAudioTiming = $('#info-audio-timing');
 
 // Manage the connection with the running code
 function handleOutput(port) {
   var ws = new WebSocket("ws://" + pythonDaemon + ":" + port);
+  ws.binaryType = 'arraybuffer';
   var nbTry = 1;
   var stop = false; // se to true when the close of this handleOutput is asked
+  var pendingArrays = null; // header of a data message whose arrays are in the next binary message
 
   // Try multiple times to connect
   // Useful because we don't know after how much time
@@ -481,7 +485,10 @@ function handleOutput(port) {
   $('#output-panes .output-pane').remove();
 
   ws.onmessage = function(e) {
-    if (typeof e.data != "string") { // we have binary data: it's audio
+    if (typeof e.data != "string" && pendingArrays) { // the arrays of a data handler
+      dataHandlers.addNewBinaryData(pendingArrays.dataHandler, pendingArrays, e.data);
+      pendingArrays = null;
+    } else if (typeof e.data != "string") { // we have binary data: it's audio
       if (!outputStream || outputStream.isStopped()) {
         outputStream = new sourceAudio(audioCt, config);
       }
@@ -497,6 +504,8 @@ function handleOutput(port) {
         });
         $('#output-tab-' + data.id).tab('show');
         dataHandlers.addHandler(data.id, data.type, document.getElementById('graph-' + data.id), data.parameters);
+      } else if (data.dataHandler && data.arrays) {
+        pendingArrays = data;
       } else if (data.dataHandler) {
         dataHandlers.addNewData(data.dataHandler, data.data);
       } else if (data.latency) {
@@ -514,6 +523,23 @@ function handleOutput(port) {
           infosAudioLatency.removeClass('tag-success');
           infosAudioLatency.addClass('tag-danger');
         }
+        if (data.dropped !== undefined) {
+          infosAudioDropped.text(data.dropped + ' / ' + (data.dropped + data.processed));
+          if (data.dropped > 0) {
+            infosAudioDropped.addClass('tag-warning');
+          } else {
+            infosAudioDropped.removeClass('tag-warning');
+          }
+        }
+      } else if (data.timing) {
+        // 90th percentile of each stage, the other statistics in the tooltip
+        var stages = ['network', 'queue', 'process', 'send'];
+        infosAudioTiming.text(_.map(stages, function (stage) {
+          return data.timing[stage] ? Math.ceil(data.timing[stage].p90) : '-';
+        }).join(' / ') + ' ms');
+        infosAudioTiming.attr('title', _.map(data.timing, function (t, stage) {
+          return stage + ': p50 ' + t.p50.toFixed(1) + ', p99 ' + t.p99.toFixed(1) + ', max ' + t.max.toFixed(1) + ' ms';
+        }).join('\n'));
       } else {
         console.warn("handleOutput - ws.onmessage: unknow message type:", data);
       }
@@ -635,62 +661,68 @@ function sourceAudio(audioCtx, config) {
       return;
     }
 
-    // Otherwise, process incoming data
-    var fileReader = new FileReader();
-
-    fileReader.onload = function() {
-      var data = new Int16Array(this.result);
-
-      var n_samples = data.length / config.channels;
+    // Otherwise, process incoming data: either an ArrayBuffer,
+    // or a Blob which must be read first
+    if (data instanceof ArrayBuffer) {
+      addSamples(data);
+    } else {
+      var fileReader = new FileReader();
+      fileReader.onload = function() {
+        addSamples(this.result);
+      };
+      fileReader.readAsArrayBuffer(data);
+    }
+  }
 
-      while (frac_time <= n_samples - 1)
-      {
-        var n1 = Math.floor(frac_time);
-        var n2 = Math.ceil(frac_time);
+  function addSamples(buffer) {
+    var data = new Int16Array(buffer);
 
-        for (var ch = 0 ; ch < config.channels ; ch++) {
-          if (n1 < 0) {
-            p1 = state[ch] / 256 / 128;
-          } else {
-            p1 = data[n1 * config.channels + ch] / 256 / 128;
-          }
-          p2 = data[n2 * config.channels + ch] / 256 / 128;
+    var n_samples = data.length / config.channels;
 
-          // Linear interpolation
-          channelData[ch][current_buffer_filling] = (p2 - p1) * (frac_time - n1) + p1;
-        }
+    while (frac_time <= n_samples - 1)
+    {
+      var n1 = Math.floor(frac_time);
+      var n2 = Math.ceil(frac_time);
 
-        // increment current buffer counter
-        current_buffer_filling += 1;
-        
-        // Current buffer is full. We need a new buffer
-        if (current_buffer_filling == buffer_size) {
-          // add current buffer to the cache
-          cache.push(current_buffer);
-
-          // create a new buffer
-          current_buffer = audioCtx.createBuffer(config.channels, buffer_size, config.rate);
-          current_buffer_filling = 0;
-          for (var ch = 0; ch < config.channels; ch++) {
-            channelData[ch] = current_buffer.getChannelData(ch);
-          }
+      for (var ch = 0 ; ch < config.channels ; ch++) {
+        if (n1 < 0) {
+          p1 = state[ch] / 256 / 128;
+        } else {
+          p1 = data[n1 * config.channels + ch] / 256 / 128;
         }
+        p2 = data[n2 * config.channels + ch] / 256 / 128;
 
-        // move time
-        frac_time += time_step;
+        // Linear interpolation
+        channelData[ch][current_buffer_filling] = (p2 - p1) * (frac_time - n1) + p1;
       }
 
-      // Save the last sample of each channel in the state
-      for (var ch = 0 ; ch < config.channels ; ch++) {
-        state[ch] = data[data.length - config.channels + ch];
+      // increment current buffer counter
+      current_buffer_filling += 1;
+      
+      // Current buffer is full. We need a new buffer
+      if (current_buffer_filling == buffer_size) {
+        // add current buffer to the cache
+        cache.push(current_buffer);
+
+        // create a new buffer
+        current_buffer = audioCtx.createBuffer(config.channels, buffer_size, config.rate);
+        current_buffer_filling = 0;
+        for (var ch = 0; ch < config.channels; ch++) {
+          channelData[ch] = current_buffer.getChannelData(ch);
+        }
       }
 
-      // Remove the data size from the fractional time
-      frac_time -= n_samples;
+      // move time
+      frac_time += time_step;
+    }
 
-    };
+    // Save the last sample of each channel in the state
+    for (var ch = 0 ; ch < config.channels ; ch++) {
+      state[ch] = data[data.length - config.channels + ch];
+    }
 
-    fileReader.readAsArrayBuffer(data);
+    // Remove the data size from the fractional time
+    frac_time -= n_samples;
   }
 
   function destroyAudio() {